@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the launch of many concurrent short commands (like the mount and
+umount calls of a mass mount) with posix_spawn and with subprocess, with
+fork + exec ('fork') and as is ('subprocess', that since Python 3.10 uses
+vfork when it can), from a parent process made artificially large:
+
+    python benchmarks/spawn.py --launches 300 --concurrency 50 --heap 512
+
+For every launcher it prints the wall time, the mean and 95th percentile
+latency of a launch, the peak RSS of the parent and of the children and
+the minor page faults of the children. Every launcher runs in a fresh
+process, since RUSAGE_CHILDREN only grows. A vfork child borrows the
+memory of the parent until exec, so its peak RSS counts the pages of the
+parent without copying them: the page faults show the real cost.
+"""
+from __future__ import unicode_literals, absolute_import, print_function
+
+import json
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from pygmount.core.history import percentile
+from pygmount.core.process import execute, USE_POSIX_SPAWN
+
+
+LAUNCHERS = ['fork', 'subprocess', 'posix_spawn']
+
+
+def peak_rss():
+    """
+    Return the peak RSS in MB of this process, from /proc if available.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(launcher, launches, concurrency, heap, command):
+    posix_spawn = launcher == 'posix_spawn'
+    if launcher == 'fork':
+        subprocess._USE_VFORK = False
+    # touch every page, so that fork has to copy the page tables of it all
+    ballast = bytearray(heap * 1024 * 1024)
+    for i in range(0, len(ballast), 4096):
+        ballast[i] = 1
+    latencies = []
+    lock = threading.Lock()
+    semaphore = threading.Semaphore(concurrency)
+
+    def launch():
+        with semaphore:
+            start = time.time()
+            execute(command, posix_spawn=posix_spawn)
+            with lock:
+                latencies.append(time.time() - start)
+
+    threads = [threading.Thread(target=launch) for _ in range(launches)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.time() - start
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {'launcher': launcher,
+            'launches': launches,
+            'wall_s': round(wall, 3),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            'p95_ms': round(percentile(sorted(latencies), 95) * 1000, 2),
+            'parent_peak_rss_mb': round(peak_rss(), 1),
+            'child_peak_rss_mb': round(children.ru_maxrss / 1024.0, 1),
+            'child_minor_faults': children.ru_minflt}
+
+
+def main():
+    p = optparse.OptionParser(usage='%prog [options]')
+    p.add_option('--launches', type='int', default=300,
+                 help='Number of commands launched')
+    p.add_option('--concurrency', type='int', default=50,
+                 help='Launches running at the same time')
+    p.add_option('--heap', type='int', default=512,
+                 help='MB allocated by the parent before launching')
+    p.add_option('--command', default='true',
+                 help='Command launched')
+    p.add_option('--launcher', choices=LAUNCHERS,
+                 help=optparse.SUPPRESS_HELP)
+    options, arguments = p.parse_args()
+
+    if options.launcher:
+        print(json.dumps(run(options.launcher, options.launches,
+                             options.concurrency, options.heap,
+                             options.command)))
+        return 0
+    for launcher in LAUNCHERS:
+        if launcher == 'posix_spawn' and not USE_POSIX_SPAWN:
+            continue
+        output = subprocess.check_output(
+            [sys.executable, __file__, '--launcher', launcher,
+             '--launches', str(options.launches),
+             '--concurrency', str(options.concurrency),
+             '--heap', str(options.heap), '--command', options.command])
+        result = json.loads(output.decode('utf-8'))
+        print(' '.join('{0}={1}'.format(key, result[key]) for key in (
+            'launcher', 'launches', 'wall_s', 'mean_ms', 'p95_ms',
+            'parent_peak_rss_mb', 'child_peak_rss_mb',
+            'child_minor_faults')))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import, print_function
+
+import sys
+import json
+import optparse
+import os
+import os.path
+from pygmount.core.lint import lint_report, SEVERITY_ERROR
+
+RC_SUFFIX = '.rc'
+
+
+def find_configs(paths):
+    """
+    Return the files in 'paths': the files themselves and the files ending
+    with '.rc' into the directories (recursively), sorted.
+    """
+    filenames = []
+    for path in paths:
+        if not os.path.isdir(path):
+            filenames.append(path)
+            continue
+        for root, directories, files in os.walk(path):
+            directories.sort()
+            filenames.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.endswith(RC_SUFFIX))
+    return filenames
+
+
+def main():
+    description_msg = u'Check the rc files of mount-smb-shares'
+    p = optparse.OptionParser(description=description_msg,
+                              prog='pygmount-lint',
+                              version='0.1.1',
+                              usage="%prog [options] FILE|DIRECTORY...")
+    p.add_option("--jobs", "-j", action="store", type="int",
+                 default=None,
+                 help="Worker processes (default: one per CPU)")
+    p.add_option("--home", action="store",
+                 default=None,
+                 help="Home directory of the relative mountpoints")
+    p.add_option("--json", action="store_true",
+                 default=False, help="Print the report as JSON")
+
+    options, arguments = p.parse_args()
+    if not arguments:
+        p.error('no rc file given')
+
+    report = lint_report(find_configs(arguments), options.jobs, options.home)
+    if options.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        for issue in report['issues']:
+            print('{0}:{1}: {2} {3}: {4}'.format(
+                issue['filename'], issue['section'] or '', issue['severity'],
+                issue['code'], issue['message']))
+        print('{0} files, {1} errors, {2} warnings'.format(
+            report['files'], report['errors'], report['warnings']))
+    sys.exit(1 if any(issue['severity'] == SEVERITY_ERROR
+                      for issue in report['issues']) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,338 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from __future__ import unicode_literals, absolute_import
+from __future__ import unicode_literals, absolute_import, print_function
 
 import sys
+import getpass
+import json
+import logging
 import optparse
-from pygmount.utils.mount import MountSmbShares
+import os
+import os.path
+import pwd
+from pygmount.core.bench import bench_directory
+from pygmount.core.breaker import CircuitBreaker, BREAKER_FILE
+from pygmount.core.history import HistoryStore, HISTORY_FILE, PERCENTILES
+from pygmount.core.logs import setup_logging, LOG_FILE
+from pygmount.core.listener import Listener, refresh_shares, send_trigger
+from pygmount.core.profiles import TuningCache, TUNING_FILE
+from pygmount.core.mtab import read_mount_table
+from pygmount.core.negotiation import DialectCache, NEGOTIATION_FILE
+from pygmount.core.pipeline import Pipeline
+from pygmount.core.runlock import RunLock
+from pygmount.core.samba import (MountSmbShares, MountCifsWrapper,
+                                 MAX_WORKERS, MULTIUSER_ROOT,
+                                 MULTIUSER_SECURITY, MULTIUSER_SECURITIES)
+from pygmount.core.status import share_states, STATE_MOUNTED
+from pygmount.core.units import write_units
+
+REQUIRED_PACKAGES = ['cifs-utils']
+MSG_ERROR = 'Impossibile collegare le unità di rete [{0}].'
+
+
+def terminal_prompt(server, username):
+    """
+    Ask the domain credentials on the terminal.
+    """
+    prompt = 'Utente del Dominio/Posta Elettronica [{0}]: '.format(username)
+    try:
+        entered = raw_input(prompt)
+    except NameError:
+        entered = input(prompt)
+    password = getpass.getpass('Password del Dominio/Posta Elettronica: ')
+    return entered or username, password
+
+
+def zenity_prompt(server, username):
+    """
+    Ask the domain credentials with Zenity dialogs.
+    """
+    from PyZenity import GetText
+    entered = GetText(text="Inserisci l'utente del Dominio/Posta "
+                           "Elettronica", entry_text=username)
+    if not entered:
+        return None
+    password = GetText(text="Inserisci la password del Dominio/Posta "
+                            "Elettronica", entry_text='password',
+                       password=True)
+    return entered, password
+
+
+def zenity_error(message):
+    """
+    Show an error with a Zenity dialog.
+    """
+    from PyZenity import ErrorMessage
+    ErrorMessage(message)
+
+
+def user_paths(options):
+    """
+    Return the home directory of the user that called sudo (or of the
+    current user) and the rc file to use.
+    """
+    username = os.environ.get('SUDO_USER') or getpass.getuser()
+    home = os.path.expanduser('~{0}'.format(username))
+    return home, options.file or os.path.join(home, '.pygmount.rc')
+
+
+def user_file(home, path):
+    """
+    Return 'path' with a leading '~' meaning 'home' (the home directory of
+    the user that called sudo, see user_paths) instead of root's one.
+    """
+    if path == '~' or path.startswith('~/'):
+        return os.path.join(home, path[2:])
+    return os.path.expanduser(path)
+
+
+def owner_options():
+    """
+    Return the mount options that give the files of the shares to the user
+    that called sudo (its uid and gid), none without sudo.
+    """
+    username = os.environ.get('SUDO_USER')
+    if not username:
+        return {}
+    try:
+        user = pwd.getpwnam(username)
+    except KeyError:
+        return {}
+    return {'uid': str(user.pw_uid), 'gid': str(user.pw_gid)}
+
+
+def user_shares(options, **kwargs):
+    """
+    Return a MountSmbShares of the rc file and the home directory of the
+    user that called sudo, whose files are owned by that user unless the
+    shares set 'uid' and 'gid'. The run history (--history), the circuit
+    breaker, the dialect cache and the tuning cache are kept in that home,
+    and the runs of the user are serialized by its RunLock. 'kwargs' are
+    passed to MountSmbShares.
+    """
+    home, config_file = user_paths(options)
+    return MountSmbShares(
+        config_file=config_file, home=home,
+        history=HistoryStore(user_file(home, options.history)),
+        breaker=CircuitBreaker(user_file(home, BREAKER_FILE)),
+        dialects=DialectCache(user_file(home, NEGOTIATION_FILE)),
+        tuning=TuningCache(user_file(home, TUNING_FILE)),
+        run_lock=RunLock(), default_options=owner_options(), **kwargs)
+
+
+def start_logging(options):
+    """
+    Log to the --log-file (by default ~/.pygmount.log of the user that
+    called sudo) from INFO up and to stderr from WARNING up (from INFO up
+    with --verbose).
+    """
+    home = user_paths(options)[0]
+    return setup_logging(
+        filename=user_file(home, options.log_file or LOG_FILE),
+        level=logging.INFO, json_lines=options.log_json, stream=sys.stderr,
+        stream_level=logging.INFO if options.verbose else logging.WARNING)
+
+
+def selection(options):
+    """
+    Return the keyword arguments of MountSmbShares.set_shares for the
+    --only and --tag options.
+    """
+    only = ([name.strip() for value in options.only
+             for name in value.split(',') if name.strip()]
+            if options.only else None)
+    return {'only': only, 'tags': options.tags or None}
+
+
+def mount(options):
+    """
+    Mount the configured shares with the core pipeline, for the user that
+    called sudo if any, and print the failures (or the plan with
+    --dry-run). Without --shell-mode the errors are also shown with Zenity.
+    """
+    mss = user_shares(
+        options, multiuser=options.multiuser,
+        multiuser_sec=options.multiuser_sec,
+        deduplicate=options.deduplicate,
+        check_credentials=options.check_credentials,
+        credentials_prompt=(terminal_prompt if options.shell_mode
+                            else zenity_prompt))
+    mss.required_packages = REQUIRED_PACKAGES
+    pipeline = Pipeline(dry_run=options.dry_run,
+                        max_workers=options.max_workers,
+                        budget=options.budget, **selection(options))
+    try:
+        returncode = mss.run(pipeline)
+    finally:
+        mss.history.close()
+    errors = [str(pipeline.error)] if pipeline.error is not None else []
+    for result in (mss.report.results if mss.report is not None else []):
+        if options.dry_run:
+            print('{0:<30} {1:<8} {2}'.format(result.name, result.action,
+                                              result.output or ''))
+        elif result.returncode != 0:
+            error = '{0}: {1} ({2})'.format(result.name, result.action,
+                                            result.returncode)
+            print(error, file=sys.stderr)
+            errors.append(error)
+    if errors and not options.shell_mode:
+        zenity_error(MSG_ERROR.format('\n'.join(errors)))
+    return returncode
+
+
+def print_status(options):
+    """
+    Print the state of every configured share against the mount table:
+    mounted, missing, mismatched-options or stale. Return 0 if all the
+    shares are mounted, 1 otherwise.
+    """
+    home, config_file = user_paths(options)
+    mss = MountSmbShares(config_file=config_file, home=home)
+    mss.set_shares(**selection(options))
+    statuses = share_states(mss.shares)
+    if options.json:
+        print(json.dumps([status._asdict() for status in statuses],
+                         indent=2, sort_keys=True))
+    else:
+        for status in statuses:
+            print('{0:<30} {1:<18} {2} {3}'.format(
+                status.name, status.state, status.mountpoint, ' '.join(
+                    '{0}={1}'.format(key, value) for key, value in
+                    sorted(status.differences.items()))).rstrip())
+    return 0 if all(status.state == STATE_MOUNTED
+                    for status in statuses) else 1
+
+
+def print_stats(options):
+    """
+    Print the latency percentiles and failure rates per share and per server
+    recorded into the history store.
+    """
+    home = user_paths(options)[0]
+    store = HistoryStore(user_file(home, options.history))
+    stats = dict((key, store.stats(key)) for key in ('share', 'server'))
+    store.close()
+    if options.json:
+        print(json.dumps(stats, indent=2, sort_keys=True))
+        return 0
+    columns = ['p{0}'.format(p) for p in PERCENTILES]
+    for key in ('share', 'server'):
+        print('{0:<40} {1:>6} {2:>8} {3}'.format(
+            key, 'count', 'failures', ' '.join(
+                '{0:>8}'.format(column) for column in columns)))
+        for row in stats[key]:
+            print('{0:<40} {1:>6} {2:>7.1%} {3}'.format(
+                row[key], row['count'], row['failure_rate'], ' '.join(
+                    '{0:>8}'.format('-') if row[column] is None
+                    else '{0:>7.2f}s'.format(row[column])
+                    for column in columns)))
+        print()
+    return 0
+
+
+def generate_units(options):
+    """
+    Write the systemd mount/automount units (or the autofs map) of the
+    configured shares (of the user that called sudo, with the same owner
+    options as mount) into the output directory.
+    """
+    home, config_file = user_paths(options)
+    mss = MountSmbShares(config_file=config_file, home=home,
+                         default_options=owner_options())
+    mss.set_shares(**selection(options))
+    for path in write_units(mss.shares, options.output,
+                            autofs=options.autofs):
+        print(path)
+    return 0
+
+
+def tune_shares(options, names):
+    """
+    Auto-tune the configured shares (or only 'names') and print the scores
+    of every candidate profile as JSON.
+    """
+    mss = user_shares(options)
+    mss.set_shares(**selection(options))
+    results = {}
+    for share in mss.shares:
+        if (names and share.name not in names or
+                not isinstance(share.wrapper, MountCifsWrapper)):
+            continue
+        best, scores = mss.tune_share(share)
+        results[share.name] = {'server': share.wrapper.server,
+                               'best': best, 'scores': scores}
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return 0
+
+
+def bench_shares(options, paths):
+    """
+    Benchmark the given directories (by default the mountpoints of the
+    configured shares of the user that called sudo that are mounted) and
+    print the results as JSON.
+    """
+    if not paths:
+        home, config_file = user_paths(options)
+        mss = MountSmbShares(config_file=config_file, home=home)
+        mss.set_shares(**selection(options))
+        mounted = set(entry.mountpoint for entry in read_mount_table())
+        paths = [(share.name, share.wrapper.mountpoint)
+                 for share in mss.shares
+                 if share.wrapper.mountpoint in mounted]
+    else:
+        paths = [(path, path) for path in paths]
+    results = {}
+    for name, path in paths:
+        try:
+            results[name] = bench_directory(
+                path, size=options.bench_size * 1024 * 1024)
+        except (IOError, OSError) as e:
+            results[name] = {'error': str(e)}
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return 0
+
+
+def listen(options):
+    """
+    Mount the configured shares with the core pipeline (asking the
+    credentials as mount does), then wait for the network changes, the
+    resumes from sleep and the local triggers and remount the shares of the
+    reachable servers after every one of them.
+    """
+    mss = user_shares(
+        options, multiuser=options.multiuser,
+        multiuser_sec=options.multiuser_sec,
+        deduplicate=options.deduplicate,
+        check_credentials=options.check_credentials,
+        credentials_prompt=(terminal_prompt if options.shell_mode
+                            else zenity_prompt))
+    mss.required_packages = REQUIRED_PACKAGES
+    try:
+        returncode = mss.run(Pipeline(max_workers=options.max_workers,
+                                      **selection(options)))
+        if mss.report is None:
+            return returncode
+        with Listener() as listener:
+            try:
+                listener.serve_forever(lambda reasons: refresh_shares(
+                    mss, options.max_workers))
+            except KeyboardInterrupt:
+                pass
+    finally:
+        mss.history.close()
+    return 0
+
+
+def trigger(options):
+    """
+    Ask the running listener to remount the shares.
+    """
+    try:
+        send_trigger()
+    except (IOError, OSError) as e:
+        print('no listener running: {0}'.format(e), file=sys.stderr)
+        return 1
+    return 0
 
 
 def main():
@@ -12,7 +340,9 @@ def main():
     p = optparse.OptionParser(description=description_msg,
                               prog='mount-smb-shares',
                               version='0.1.1',
-                              usage="%prog [options]")
+                              usage="%prog [options] [status|stats|units|"
+                                    "tune [SHARE...]|bench [PATH...]|"
+                                    "listen|trigger]")
     p.add_option("--verbose", "-v", action="store_true",
                  default=False, help="Enables verbose output")
     p.add_option("--file", "-f", action="store",
@@ -23,14 +353,81 @@ def main():
     p.add_option("--shell-mode", "-s", action="store_true",
                  default=False, dest='shell_mode',
                  help="Run commands without Zenity support")
+    p.add_option("--history", action="store",
+                 default=HISTORY_FILE, help="Path's run history database")
+    p.add_option("--json", action="store_true",
+                 default=False,
+                 help="Print the output of status and stats as JSON")
+    p.add_option("--output", "-o", action="store",
+                 default='.', help="Output directory of units")
+    p.add_option("--autofs", action="store_true",
+                 default=False, help="Generate an autofs map with units")
+    p.add_option("--bench-size", action="store", type="int",
+                 default=64, dest='bench_size',
+                 help="Size in MB of the test file of bench")
+    p.add_option("--max-workers", action="store", type="int",
+                 default=MAX_WORKERS, dest='max_workers',
+                 help="Shares mounted at the same time")
+    p.add_option("--budget", action="store", type="float",
+                 default=None,
+                 help="Seconds to wait before leaving the mounts still in "
+                      "progress to a background worker")
+    p.add_option("--only", action="append", default=[],
+                 metavar="NAME[,NAME]",
+                 help="Use only the named shares (repeatable)")
+    p.add_option("--tag", action="append", default=[], dest='tags',
+                 metavar="TAG",
+                 help="Use only the shares with this tag (repeatable)")
+    p.add_option("--multiuser", action="store_true",
+                 default=False,
+                 help="Mount the shares once for the whole host (CIFS "
+                      "multiuser), by default and relative mountpoints "
+                      "into {0}".format(MULTIUSER_ROOT))
+    p.add_option("--multiuser-sec", dest='multiuser_sec', type='choice',
+                 choices=MULTIUSER_SECURITIES, default=MULTIUSER_SECURITY,
+                 help="Security of the multiuser mounts: with krb5 (the "
+                      "default) the users' Kerberos tickets are used, with "
+                      "ntlmssp the credentials are added to the kernel "
+                      "keyring of the user")
+    p.add_option("--deduplicate", action="store_true",
+                 default=False,
+                 help="Mount every service once and bind mount the other "
+                      "shares of it")
+    p.add_option("--check-credentials", action="store_true",
+                 default=False, dest='check_credentials',
+                 help="Verify the credentials once per server before "
+                      "mounting")
+
+    p.add_option("--log-file", action="store",
+                 default=None, dest='log_file',
+                 help="Path's log file, rotated (default "
+                      "~/.pygmount.log)")
+    p.add_option("--log-json", action="store_true",
+                 default=False, dest='log_json',
+                 help="Write the log as JSON lines")
 
     options, arguments = p.parse_args()
 
-    MountSmbShares(verbose=options.verbose,
-                   filename=options.file,
-                   dry_run=options.dry_run,
-                   shell_mode=options.shell_mode).run()
-    sys.exit(0)
+    if arguments and arguments[0] == 'stats':
+        sys.exit(print_stats(options))
+    elif arguments and arguments[0] == 'status':
+        sys.exit(print_status(options))
+    elif arguments and arguments[0] == 'units':
+        sys.exit(generate_units(options))
+    elif arguments and arguments[0] == 'tune':
+        sys.exit(tune_shares(options, arguments[1:]))
+    elif arguments and arguments[0] == 'bench':
+        sys.exit(bench_shares(options, arguments[1:]))
+    elif arguments and arguments[0] == 'listen':
+        start_logging(options)
+        sys.exit(listen(options))
+    elif arguments and arguments[0] == 'trigger':
+        sys.exit(trigger(options))
+    elif arguments:
+        p.error('unknown command "{0}"'.format(arguments[0]))
+
+    start_logging(options)
+    sys.exit(mount(options))
 
 if __name__ == '__main__':
     main()
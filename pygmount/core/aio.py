@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio interface of the mount engine (Python >= 3.7 only), for the
+daemons that drive the mounts from their event loop:
+
+    batch = mss.mount_all()
+    async for result in batch:
+        ...
+    report = await wait_report(batch)
+
+Cancelling the task that iterates a batch (or leaving the loop early)
+cancels the mounts not started yet.
+"""
+import asyncio
+
+from pygmount.core.samba import MAX_WORKERS
+
+
+async def iter_results(batch):
+    """
+    Yield the MountResult of every share of 'batch' as soon as it is
+    available. The cancelled shares are skipped.
+    """
+    loop = asyncio.get_running_loop()
+    pending = set(asyncio.wrap_future(future, loop=loop)
+                  for future in batch.futures.values())
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if not future.cancelled():
+                    yield future.result()
+    finally:
+        if pending:
+            batch.cancel()
+
+
+async def wait_report(batch):
+    """
+    Wait for the end of the run of 'batch' and return its RunReport.
+    """
+    return await asyncio.wrap_future(batch.report)
+
+
+async def mount_all(mss, max_workers=MAX_WORKERS, limiter=None, shares=None):
+    """
+    Mount the shares of 'mss' without blocking the event loop and return
+    the RunReport. Cancelling the coroutine cancels the mounts not started
+    yet and waits for the ones in progress.
+    """
+    batch = mss.mount_all(max_workers, limiter, shares)
+    try:
+        return await asyncio.shield(wait_report(batch))
+    except asyncio.CancelledError:
+        batch.cancel()
+        await asyncio.wrap_future(batch.report)
+        raise
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import threading
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+
+ACTION_CANCELLED = 'cancelled'
+
+
+class MountBatch(object):
+    """
+    Handle of the mounts started in background by MountSmbShares.mount_all:
+    'futures' maps the name of every share to the future of its MountResult
+    and 'report' is the future of the RunReport of the whole run. A share
+    can be cancelled until its mount starts, either by cancelling its own
+    future or all together with cancel(). Iterate it with 'async for' to get
+    the results as they complete (see pygmount.core.aio).
+    """
+
+    def __init__(self, names):
+        if futures is None:
+            raise RuntimeError('mount_all requires concurrent.futures (the '
+                               '"futures" package on Python 2)')
+        self.futures = collections.OrderedDict(
+            (name, futures.Future()) for name in names)
+        self.report = futures.Future()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._notified = set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _claim(self, name):
+        """
+        Mark the future of 'name' as running. Return False if it is done or
+        was cancelled, in which case the waiters are notified once.
+        """
+        future = self.futures.get(name)
+        with self._lock:
+            if future is None or future.running() or name in self._notified:
+                return future is not None and future.running()
+            if future.done() and not future.cancelled():
+                return False
+            self._notified.add(name)
+            return future.set_running_or_notify_cancel()
+
+    def cancel(self):
+        """
+        Cancel the mounts not started yet. The mounts in progress complete.
+        Return the names of the shares cancelled.
+        """
+        self._cancelled.set()
+        names = [name for name, future in self.futures.items()
+                 if not future.cancelled() and future.cancel()]
+        for name in names:
+            self._claim(name)
+        return names
+
+    def start(self, name):
+        """
+        Called just before the mount of 'name' starts: return False if it
+        was cancelled, otherwise mark its future as running.
+        """
+        if self._cancelled.is_set():
+            self.futures[name].cancel()
+        return self._claim(name)
+
+    def set_result(self, result):
+        if self._claim(result.name):
+            self.futures[result.name].set_result(result)
+
+    def set_report(self, report):
+        self.report.set_result(report)
+
+    def set_exception(self, exception):
+        for name, future in self.futures.items():
+            if self._claim(name):
+                future.set_exception(exception)
+        self.report.set_exception(exception)
+
+    def as_completed(self, timeout=None):
+        """
+        Iterate the futures of the shares as they complete (or are
+        cancelled).
+        """
+        return futures.as_completed(list(self.futures.values()), timeout)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the end of the run and return its RunReport.
+        """
+        return self.report.result(timeout)
+
+    def __aiter__(self):
+        from pygmount.core.aio import iter_results
+        return iter_results(self)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import, division
+
+import collections
+import os
+import os.path
+import random
+import shutil
+import tempfile
+import time
+
+
+BENCH_SIZE = 64 * 1024 * 1024
+BENCH_BLOCK = 1024 * 1024
+RANDOM_BLOCK = 4096
+RANDOM_OPS = 512
+METADATA_FILES = 200
+MEGABYTE = 1024 * 1024
+
+
+def _elapsed(start):
+    return max(time.time() - start, 1e-6)
+
+
+def _drop_cache(fd):
+    # let the reads go to the server instead of the page cache, if possible
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def sequential_write(filename, size=BENCH_SIZE, block=BENCH_BLOCK):
+    """
+    Write 'size' bytes into 'filename' in blocks of 'block' bytes, syncing
+    at the end. Return the throughput in MB/s.
+    """
+    data = os.urandom(block)
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    start = time.time()
+    try:
+        for _ in range(size // block):
+            os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return size / MEGABYTE / _elapsed(start)
+
+
+def sequential_read(filename, block=BENCH_BLOCK):
+    """
+    Read 'filename' from start to end in blocks of 'block' bytes. Return
+    the throughput in MB/s.
+    """
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        _drop_cache(fd)
+        start = time.time()
+        read = 0
+        while True:
+            data = os.read(fd, block)
+            if not data:
+                break
+            read += len(data)
+    finally:
+        os.close(fd)
+    return read / MEGABYTE / _elapsed(start)
+
+
+def random_io(filename, ops=RANDOM_OPS, block=RANDOM_BLOCK, write=False):
+    """
+    Do 'ops' reads (or writes) of 'block' bytes at random aligned offsets
+    of 'filename'. Return the operations per second.
+    """
+    blocks = os.path.getsize(filename) // block
+    if not blocks:
+        return 0.0
+    offsets = [random.randrange(blocks) * block for _ in range(ops)]
+    data = os.urandom(block)
+    fd = os.open(filename, os.O_RDWR if write else os.O_RDONLY)
+    try:
+        _drop_cache(fd)
+        start = time.time()
+        for offset in offsets:
+            os.lseek(fd, offset, os.SEEK_SET)
+            if write:
+                os.write(fd, data)
+            else:
+                os.read(fd, block)
+        if write:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    return ops / _elapsed(start)
+
+
+def metadata_ops(directory, files=METADATA_FILES):
+    """
+    Create, stat and unlink 'files' empty files into 'directory'. Return the
+    operations per second.
+    """
+    names = [os.path.join(directory, 'meta-{0}'.format(i))
+             for i in range(files)]
+    start = time.time()
+    for name in names:
+        os.close(os.open(name, os.O_WRONLY | os.O_CREAT, 0o600))
+    for name in names:
+        os.stat(name)
+    for name in names:
+        os.remove(name)
+    return 3 * files / _elapsed(start)
+
+
+def bench_directory(path, size=BENCH_SIZE, block=BENCH_BLOCK,
+                    random_ops=RANDOM_OPS, metadata_files=METADATA_FILES):
+    """
+    Benchmark the filesystem of 'path' into a private temporary directory,
+    removed at the end, with a test file of at most 'size' bytes. Return an
+    ordered dict with sequential write/read in MB/s, random 4K read/write
+    and create/stat/unlink in ops/s.
+    """
+    directory = tempfile.mkdtemp(prefix='.pygmount-bench-', dir=path)
+    filename = os.path.join(directory, 'data')
+    try:
+        results = collections.OrderedDict()
+        results['seq_write_mbs'] = sequential_write(filename, size, block)
+        results['seq_read_mbs'] = sequential_read(filename, block)
+        results['rand_read_iops'] = random_io(filename, random_ops)
+        results['rand_write_iops'] = random_io(filename, random_ops,
+                                               write=True)
+        results['metadata_ops'] = metadata_ops(directory, metadata_files)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return collections.OrderedDict(
+        (key, round(value, 2)) for key, value in results.items())
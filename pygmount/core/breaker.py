@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import errno
+import re
+import threading
+import time
+
+from pygmount.core.store import ServerStore
+
+
+BREAKER_FILE = '~/.pygmount.breaker.json'
+FAILURE_THRESHOLD = 3
+COOLDOWN = 300
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half-open'
+
+ACTION_CIRCUIT_OPEN = 'circuit-open'
+
+# errors of mount.cifs telling that the server can't be reached at all
+NETWORK_ERRORS = frozenset([errno.ENETUNREACH, errno.ETIMEDOUT,
+                            errno.ECONNREFUSED, errno.EHOSTDOWN,
+                            errno.EHOSTUNREACH])
+_MOUNT_ERROR = re.compile(r'mount error\((\d+)\)')
+
+
+def mount_error_codes(output):
+    """
+    Return the list of the error codes in the "mount error(N)" lines of the
+    output of mount.cifs (a str or bytes).
+    """
+    if not output:
+        return []
+    if isinstance(output, bytes):
+        output = output.decode('utf-8', 'replace')
+    return [int(code) for code in _MOUNT_ERROR.findall(output)]
+
+
+def is_network_failure(output):
+    """
+    Return True if the output of a failed mount says that the server was
+    unreachable (as opposed to e.g. refused credentials or a missing share).
+    """
+    if not output:
+        return False
+    if isinstance(output, bytes):
+        output = output.decode('utf-8', 'replace')
+    if 'could not resolve address' in output:
+        return True
+    return any(code in NETWORK_ERRORS for code in mount_error_codes(output))
+
+
+class CircuitBreaker(ServerStore):
+    """
+    Persistent negative cache of the servers that keep failing. After
+    'threshold' consecutive network failures the circuit of a server opens
+    and its mounts are skipped for 'cooldown' seconds. Then a single probe
+    mount is let through (half-open): its success closes the circuit, its
+    failure opens it again for another cooldown.
+    """
+
+    def __init__(self, filename=BREAKER_FILE, threshold=FAILURE_THRESHOLD,
+                 cooldown=COOLDOWN):
+        super(CircuitBreaker, self).__init__(filename,
+                                             threading.Condition())
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._probing = set()
+
+    def state(self, server, now=None):
+        data = self._servers.get(server)
+        if data is None or data.get('opened') is None:
+            return STATE_CLOSED
+        if (now or time.time()) - data['opened'] < self.cooldown:
+            return STATE_OPEN
+        return STATE_HALF_OPEN
+
+    def allow(self, server, now=None):
+        """
+        Return True if a mount on 'server' may be attempted. When the circuit
+        is half-open the first caller gets the probe, the others wait for
+        its outcome.
+        """
+        with self._lock:
+            while True:
+                state = self.state(server, now)
+                if state == STATE_CLOSED:
+                    return True
+                if state == STATE_OPEN:
+                    return False
+                if server not in self._probing:
+                    self._probing.add(server)
+                    return True
+                self._lock.wait()
+
+    def record(self, server, ok, now=None):
+        """
+        Record the outcome of a mount on 'server', where ok=False means that
+        the server could not be reached.
+        """
+        with self._lock:
+            probe = server in self._probing
+            self._probing.discard(server)
+            if ok:
+                self._servers.pop(server, None)
+            else:
+                data = self._servers.setdefault(
+                    server, {'failures': 0, 'opened': None})
+                data['failures'] += 1
+                if probe or data['failures'] >= self.threshold:
+                    data['opened'] = now or time.time()
+            self._lock.notify_all()
+
+    def release(self, server):
+        """
+        Give back the probe of a half-open circuit taken by allow() for a
+        mount that was not attempted (e.g. cancelled), so that the next
+        caller gets it instead of waiting forever.
+        """
+        with self._lock:
+            self._probing.discard(server)
+            self._lock.notify_all()
+
+    def snapshot(self):
+        with self._lock:
+            return dict((server, dict(data, state=self.state(server)))
+                        for server, data in self._servers.items())
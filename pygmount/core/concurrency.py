@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import, division
+
+import threading
+
+
+DEFAULT_ESTIMATE = 2.0
+
+
+def longest_first(shares, estimates, default=DEFAULT_ESTIMATE):
+    """
+    Order the entries of MountSmbShares.shares by expected duration, slowest
+    first (LPT scheduling), so that the longest mounts start first and the
+    total time of a pool of workers approaches its minimum. The shares
+    without an estimate are expected to last 'default' seconds; shares with
+    the same estimate keep their configured order.
+    """
+    return sorted(shares, key=lambda share: -estimates.get(share[0], default))
+
+
+class AdaptiveLimiter(object):
+    """
+    AIMD concurrency limiter for the mounts of every server. The number of
+    concurrent mounts allowed for a server grows by 'increase' after every
+    mount that completes within 'target_latency' seconds and is multiplied
+    by 'decrease_factor' after a mount that fails or is slower than that.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=16, target_latency=5.0,
+                 increase=1, decrease_factor=0.5, alpha=0.3):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.alpha = alpha
+        self._condition = threading.Condition()
+        self._servers = {}
+
+    def _state(self, server):
+        if server not in self._servers:
+            self._servers[server] = {'limit': float(self.initial),
+                                     'inflight': 0, 'latency': None,
+                                     'mounts': 0, 'failures': 0}
+        return self._servers[server]
+
+    def acquire(self, server):
+        """
+        Block until a new mount on 'server' is allowed by its current limit.
+        """
+        with self._condition:
+            state = self._state(server)
+            while state['inflight'] >= int(state['limit']):
+                self._condition.wait()
+            state['inflight'] += 1
+
+    def release(self, server, latency=None, ok=True):
+        """
+        Release a mount slot of 'server' and adapt its limit to the outcome
+        of the mount. With latency None (e.g. nothing was mounted) the limit
+        is not changed.
+        """
+        with self._condition:
+            state = self._state(server)
+            state['inflight'] -= 1
+            if latency is not None:
+                state['mounts'] += 1
+                state['latency'] = (
+                    latency if state['latency'] is None else
+                    self.alpha * latency +
+                    (1 - self.alpha) * state['latency'])
+                if ok and latency <= self.target_latency:
+                    state['limit'] = min(self.maximum,
+                                         state['limit'] + self.increase)
+                else:
+                    if not ok:
+                        state['failures'] += 1
+                    state['limit'] = max(
+                        self.minimum, state['limit'] * self.decrease_factor)
+            self._condition.notify_all()
+
+    def limit(self, server):
+        with self._condition:
+            return int(self._state(server)['limit'])
+
+    def snapshot(self):
+        """
+        Return a dict server -> current limit, mounts in flight, average
+        latency and failure rate.
+        """
+        with self._condition:
+            return dict(
+                (server, {
+                    'limit': int(state['limit']),
+                    'inflight': state['inflight'],
+                    'latency': (round(state['latency'], 3)
+                                if state['latency'] is not None else None),
+                    'mounts': state['mounts'],
+                    'failure_rate': (state['failures'] / state['mounts']
+                                     if state['mounts'] else 0.0)})
+                for server, state in self._servers.items())
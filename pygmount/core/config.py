@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import glob
+import os.path
+
+
+# section of the settings of the rc file itself, not a share
+SETTINGS_SECTION = 'pygmount'
+# prefix of the sections of the named templates, not shares
+TEMPLATE_PREFIX = 'template:'
+TEMPLATE_KEY = 'template'
+INCLUDE_KEY = 'include'
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def read_includes(config, filename):
+    """
+    Read into 'config' the files listed (',' separated, glob patterns
+    allowed, relative to the directory of 'filename') by the 'include' key
+    of the [pygmount] section of 'filename' and of the included files. Every
+    file is read once; the values of the files read later win. Return the
+    list of the files read.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    read = [os.path.abspath(filename)]
+    while config.has_option(SETTINGS_SECTION, INCLUDE_KEY):
+        paths = [path
+                 for pattern in _split(config.get(SETTINGS_SECTION,
+                                                  INCLUDE_KEY))
+                 for path in sorted(glob.glob(os.path.join(
+                     directory, os.path.expanduser(pattern))))
+                 if os.path.abspath(path) not in read]
+        if not paths:
+            break
+        for path in paths:
+            read.append(os.path.abspath(path))
+            config.read(path)
+    return read[1:]
+
+
+def share_sections(config):
+    """
+    Return the sections of 'config' that are shares.
+    """
+    return [section for section in config.sections()
+            if section != SETTINGS_SECTION and
+            not section.startswith(TEMPLATE_PREFIX)]
+
+
+def _own_items(config, section):
+    # the items set into the section itself, without the [DEFAULT] ones
+    sections = getattr(config, '_sections', None)
+    if sections is None or section not in sections:
+        return collections.OrderedDict(config.items(section))
+    return collections.OrderedDict(
+        (key, config.get(section, key))
+        for key in sections[section] if key != '__name__')
+
+
+def template_items(config, name, cache, chain=()):
+    """
+    Return an ordered dict with the items of the template 'name' (section
+    [template:name]) merged over the ones of its own 'template', if any.
+    The expanded templates are stored into the dict 'cache', so every
+    inheritance chain is resolved once. Raise ValueError for unknown and
+    circular templates.
+    """
+    if name in cache:
+        return cache[name]
+    if name in chain:
+        raise ValueError('Template circolare: {0}.'.format(
+            ' -> '.join(chain + (name,))))
+    section = TEMPLATE_PREFIX + name
+    if not config.has_section(section):
+        raise ValueError('Il template "{0}" non e\' definito.'.format(name))
+    own = _own_items(config, section)
+    parent = own.pop(TEMPLATE_KEY, None)
+    items = collections.OrderedDict()
+    if parent:
+        items.update(template_items(config, parent.strip(), cache,
+                                    chain + (name,)))
+    items.update(own)
+    cache[name] = items
+    return items
+
+
+def section_items(config, section, cache):
+    """
+    Return an ordered dict with the items of the share 'section': its own
+    items win over the ones of its template (also set by [DEFAULT]), which
+    win over the ones of [DEFAULT]. See template_items for 'cache'.
+    """
+    items = collections.OrderedDict(config.items(section))
+    own = _own_items(config, section)
+    template = items.pop(TEMPLATE_KEY, None)
+    own.pop(TEMPLATE_KEY, None)
+    result = collections.OrderedDict(
+        (key, value) for key, value in items.items() if key not in own)
+    if template:
+        result.update(template_items(config, template.strip(), cache))
+    result.update(own)
+    return result
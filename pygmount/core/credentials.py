@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import os
+import subprocess
+import tempfile
+
+
+SMBCLIENT_COMMAND_NAME = 'smbclient'
+
+CHECK_OK = 'ok'
+CHECK_FAILED = 'failed'
+CHECK_UNKNOWN = 'unknown'
+
+ACTION_AUTH_FAILED = 'auth-failed'
+# return code of mount.cifs for a refused authentication (EACCES)
+AUTH_FAILED_RETURNCODE = 13
+
+AUTH_FAILURE_STATUSES = (
+    'NT_STATUS_LOGON_FAILURE', 'NT_STATUS_WRONG_PASSWORD',
+    'NT_STATUS_NO_SUCH_USER', 'NT_STATUS_ACCOUNT_LOCKED_OUT',
+    'NT_STATUS_ACCOUNT_DISABLED', 'NT_STATUS_ACCOUNT_EXPIRED',
+    'NT_STATUS_PASSWORD_EXPIRED', 'NT_STATUS_PASSWORD_MUST_CHANGE')
+
+
+def verify_credentials(server, username, password, domain=None):
+    """
+    Authenticate once against the IPC$ share of 'server' with smbclient,
+    passing the credentials by a private authentication file instead of the
+    command line. Return a tuple with CHECK_OK, CHECK_FAILED (the server
+    refused the credentials) or CHECK_UNKNOWN (e.g. server unreachable or
+    smbclient not installed, the mounts will tell) and the NT status or the
+    error found.
+    """
+    fd, filename = tempfile.mkstemp(prefix='pygmount-auth-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write('username = {0}\npassword = {1}\n'.format(
+                username, password))
+            if domain:
+                f.write('domain = {0}\n'.format(domain))
+        try:
+            process = subprocess.Popen(
+                [SMBCLIENT_COMMAND_NAME, '//{0}/IPC$'.format(server),
+                 '-A', filename, '-c', 'exit'],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                universal_newlines=True)
+        except OSError as e:
+            return CHECK_UNKNOWN, str(e)
+        output = process.communicate()[0] or ''
+    finally:
+        os.remove(filename)
+    if process.returncode == 0:
+        return CHECK_OK, None
+    for status in AUTH_FAILURE_STATUSES:
+        if status in output:
+            return CHECK_FAILED, status
+    return CHECK_UNKNOWN, output.strip().splitlines()[-1] if output else None
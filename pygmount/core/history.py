@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import, division
+
+import json
+import math
+import os.path
+import sqlite3
+import threading
+
+from pygmount.core.breaker import ACTION_CIRCUIT_OPEN
+from pygmount.core.credentials import ACTION_AUTH_FAILED
+from pygmount.core.pipeline import ACTION_UNREACHABLE
+from pygmount.core.reconcile import MOUNT_ACTIONS
+
+
+HISTORY_FILE = '~/.pygmount.db'
+PERCENTILES = (50, 95, 99)
+ESTIMATE_WINDOW = 10
+# actions of the shares not mounted because of their server or credentials,
+# counted as failed attempts without a latency
+FAILURE_ACTIONS = (ACTION_UNREACHABLE, ACTION_AUTH_FAILED,
+                   ACTION_CIRCUIT_OPEN)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    share TEXT NOT NULL,
+    server TEXT NOT NULL,
+    service TEXT NOT NULL,
+    action TEXT NOT NULL,
+    returncode INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    phases TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_share ON results (share);
+CREATE INDEX IF NOT EXISTS results_server ON results (server);
+"""
+
+
+def percentile(values, p):
+    """
+    Return the p-th percentile of the sorted list 'values', interpolating
+    linearly between the closest ranks.
+    """
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100
+    low, high = int(math.floor(rank)), int(math.ceil(rank))
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class HistoryStore(object):
+    """
+    Local SQLite store of the outcome, return code and phase durations of
+    every share mounted by every run.
+    """
+
+    def __init__(self, filename=HISTORY_FILE):
+        self.filename = os.path.expanduser(filename)
+        self._connection = None
+        self._lock = threading.Lock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.filename,
+                                               check_same_thread=False)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def record(self, report):
+        """
+        Store a RunReport and return the id of its run.
+        """
+        with self._lock, self.connection as connection:
+            cursor = connection.execute(
+                'INSERT INTO runs (started, duration) VALUES (?, ?)',
+                (report.started, report.duration))
+            run_id = cursor.lastrowid
+            connection.executemany(
+                'INSERT INTO results (run_id, share, server, service, action,'
+                ' returncode, duration, phases)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, result.name, result.server, result.service,
+                  result.action, result.returncode, result.duration,
+                  json.dumps(result.phases or {}))
+                 for result in report.results])
+        return run_id
+
+    def stats(self, key='share'):
+        """
+        Return a list of dicts, one for every share (key='share') or server
+        (key='server'), with the number of mount attempts, the failure rate
+        and the latency percentiles of the attempts. Runs where the share was
+        already mounted or was skipped are not counted; shares of an
+        unreachable server, with refused credentials or behind an open
+        circuit count as failed attempts without a latency (the
+        percentiles are None when there are only those).
+        """
+        if key not in ('share', 'server'):
+            raise ValueError('Unknown stats key "{0}"'.format(key))
+        actions = MOUNT_ACTIONS + FAILURE_ACTIONS
+        samples = {}
+        with self._lock:
+            rows = self.connection.execute(
+                'SELECT {0}, action, returncode, duration FROM results'
+                ' WHERE action IN ({1}) ORDER BY {0}, duration'.format(
+                    key, ', '.join('?' * len(actions))), actions)
+            for name, action, returncode, duration in rows:
+                durations, counts = samples.setdefault(name, ([], [0, 0]))
+                counts[0] += 1
+                if action in MOUNT_ACTIONS:
+                    durations.append(duration)
+                if action in FAILURE_ACTIONS or returncode != 0:
+                    counts[1] += 1
+        stats = []
+        for name in sorted(samples):
+            durations, (count, failures) = samples[name]
+            row = {key: name, 'count': count,
+                   'failure_rate': failures / count}
+            for p in PERCENTILES:
+                row['p{0}'.format(p)] = percentile(durations, p)
+            stats.append(row)
+        return stats
+
+    def expected_durations(self, window=ESTIMATE_WINDOW):
+        """
+        Return a dict share -> expected mount duration, the median of the
+        last 'window' mount attempts of the share.
+        """
+        samples = {}
+        with self._lock:
+            rows = self.connection.execute(
+                'SELECT share, duration FROM results WHERE action IN ({0})'
+                ' ORDER BY rowid DESC'.format(
+                    ', '.join('?' * len(MOUNT_ACTIONS))), MOUNT_ACTIONS)
+            for share, duration in rows:
+                durations = samples.setdefault(share, [])
+                if len(durations) < window:
+                    durations.append(duration)
+        return dict((share, percentile(sorted(durations), 50))
+                    for share, durations in samples.items())
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import multiprocessing
+import os
+import os.path
+import re
+
+try:
+    from ConfigParser import RawConfigParser, Error as ConfigError
+except ImportError:
+    from configparser import RawConfigParser, Error as ConfigError
+
+from pygmount.core.config import read_includes, share_sections, section_items
+from pygmount.core.uri import parse_share_uri
+
+
+SEVERITY_ERROR = 'error'
+SEVERITY_WARNING = 'warning'
+
+LINT_PARSE_ERROR = 'parse-error'
+LINT_TEMPLATE = 'bad-template'
+LINT_MISSING_KEY = 'missing-key'
+LINT_DEFAULT_MOUNTPOINT = 'default-mountpoint'
+LINT_UNKNOWN_OPTION = 'unknown-option'
+LINT_BAD_HOSTNAME = 'bad-hostname'
+LINT_DUPLICATE_MOUNTPOINT = 'duplicate-mountpoint'
+LINT_NESTED_MOUNTPOINT = 'nested-mountpoint'
+
+# keys of a share section read by MountSmbShares.set_shares, the others are
+# options of mount.cifs
+SHARE_KEYS = frozenset([
+    'hostname', 'share', 'mountpoint', 'hook_pre_command',
+    'hook_post_command', 'dialects', 'profile', 'priority', 'tags'])
+
+# options of mount.cifs (see mount.cifs(8)) and the generic ones of mount(8)
+CIFS_OPTIONS = frozenset([
+    'user', 'username', 'password', 'pass', 'password2', 'credentials',
+    'cred', 'uid', 'forceuid', 'noforceuid', 'cruid', 'gid', 'forcegid',
+    'noforcegid', 'idsfromsid', 'port', 'netbiosname', 'servern',
+    'file_mode', 'dir_mode', 'ip', 'addr', 'domain', 'dom', 'workgroup',
+    'domainauto', 'guest', 'iocharset', 'setuids', 'nosetuids', 'perm',
+    'noperm', 'dynperm', 'cache', 'handlecache', 'nohandlecache',
+    'handletimeout', 'rwpidforward', 'mapchars', 'nomapchars', 'mapposix',
+    'nomapposix', 'intr', 'nointr', 'hard', 'soft', 'noacl', 'cifsacl',
+    'backupuid', 'backupgid', 'nocase', 'ignorecase', 'sec', 'seal',
+    'rdma', 'resilienthandles', 'noresilienthandles', 'persistenthandles',
+    'nopersistenthandles', 'snapshot', 'nobrl', 'brl',
+    'forcemandatorylock', 'locallease', 'nolease', 'sfu', 'serverino',
+    'noserverino', 'posix', 'unix', 'linux', 'noposix', 'nounix', 'nolinux',
+    'user_xattr', 'nouser_xattr', 'rsize', 'wsize', 'bsize', 'max_credits',
+    'fsc', 'mfsymlinks', 'echo_interval', 'actimeo', 'acregmax', 'acdirmax',
+    'acregmin', 'acdirmin', 'closetimeo', 'noposixpaths', 'vers', 'nodfs',
+    'multiuser', 'multichannel', 'max_channels', 'nosharesock',
+    'noblocksend', 'noautotune', 'nostrictsync', 'strictcache', 'esize',
+    'prefixpath', 'retrans', 'sloppy', 'compress', 'witness', 'nocompress',
+    'ro', 'rw', 'exec', 'noexec', 'suid', 'nosuid', 'dev', 'nodev', 'auto',
+    'noauto', 'nofail', '_netdev', 'noatime', 'relatime', 'defaults'])
+
+HOSTNAME_RE = re.compile(r'^(?:[A-Za-z0-9_](?:[A-Za-z0-9_.-]*[A-Za-z0-9_])?'
+                         r'|\[[0-9A-Fa-f:.]+\])$')
+
+# files of every worker process task
+CHUNKSIZE = 64
+
+Issue = collections.namedtuple('Issue', ['filename', 'section', 'code',
+                                         'severity', 'message'])
+
+
+def check_hostname(value):
+    """
+    Return the reason why the 'hostname' value ('[user[:password]@]host' or
+    an URI, see parse_share_uri) is not valid, or None.
+    """
+    try:
+        uri = parse_share_uri(value)
+    except ValueError as e:
+        return str(e)
+    if uri.username is not None and not uri.username:
+        return 'empty user before "@"'
+    if value.rpartition('@')[0].count('"') % 2:
+        return 'unbalanced quotes in the credentials'
+    if not uri.host:
+        return 'empty host'
+    if not HOSTNAME_RE.match(uri.host):
+        return 'invalid host "{0}"'.format(uri.host)
+    if uri.port is not None and not uri.port.isdigit():
+        return 'invalid port "{0}"'.format(uri.port)
+    return None
+
+
+def _share(items):
+    # the share of the section or of the URI of 'hostname'
+    if items.get('share') or not items.get('hostname'):
+        return items.get('share')
+    try:
+        uri = parse_share_uri(items['hostname'])
+    except ValueError:
+        return None
+    return '/'.join(part for part in (uri.share, uri.path) if part) or None
+
+
+def _mountpoint(items, home):
+    # like MountSmbShares.set_shares
+    mountpoint = items.get('mountpoint')
+    if not mountpoint:
+        try:
+            host = parse_share_uri(items.get('hostname', '')).host
+        except ValueError:
+            host = ''
+        return os.path.join(home, host, _share(items) or '')
+    return os.path.normpath(os.path.join(home, mountpoint))
+
+
+def _directory(path):
+    return path.rstrip(os.sep) + os.sep
+
+
+def lint_config(filename, home=None):
+    """
+    Check the rc file 'filename' (with its include files) and return the
+    list of the Issue found: sections that can not be parsed, unknown or
+    circular templates, shares without 'hostname' or 'share', unknown
+    mount.cifs options, unparsable '[user[:password]@]host' and duplicate
+    or nested mountpoints. Relative mountpoints are into 'home' (by
+    default the home directory of the current user).
+    """
+    home = home or os.path.expanduser('~')
+    issues = []
+
+    def add(section, code, message, severity=SEVERITY_ERROR):
+        issues.append(Issue(filename, section, code, severity, message))
+
+    config = RawConfigParser()
+    try:
+        with open(filename) as config_file:
+            if hasattr(config, 'read_file'):
+                config.read_file(config_file, filename)
+            else:
+                config.readfp(config_file, filename)
+        read_includes(config, filename)
+    except (ConfigError, IOError, OSError) as e:
+        add(None, LINT_PARSE_ERROR, ' '.join(str(e).split()))
+        return issues
+    templates = {}
+    mountpoints = collections.OrderedDict()
+    for section in share_sections(config):
+        try:
+            items = section_items(config, section, templates)
+        except ValueError as e:
+            add(section, LINT_TEMPLATE, str(e))
+            continue
+        except ConfigError as e:
+            add(section, LINT_PARSE_ERROR, ' '.join(str(e).split()))
+            continue
+        if not items.get('hostname'):
+            add(section, LINT_MISSING_KEY, 'missing "hostname"')
+        elif not _share(items):
+            add(section, LINT_MISSING_KEY, 'missing "share"')
+        if not items.get('mountpoint'):
+            add(section, LINT_DEFAULT_MOUNTPOINT, 'missing "mountpoint", {0}'
+                ' is used'.format(_mountpoint(items, home)), SEVERITY_WARNING)
+        for key in items:
+            if key not in SHARE_KEYS and key not in CIFS_OPTIONS:
+                add(section, LINT_UNKNOWN_OPTION,
+                    'unknown option "{0}"'.format(key))
+        if items.get('hostname'):
+            reason = check_hostname(items['hostname'])
+            if reason is not None:
+                add(section, LINT_BAD_HOSTNAME, reason)
+        mountpoints.setdefault(_mountpoint(items, home), []).append(section)
+    for mountpoint, sections in mountpoints.items():
+        for section in sections[1:]:
+            add(section, LINT_DUPLICATE_MOUNTPOINT, '{0} is also the '
+                'mountpoint of "{1}"'.format(mountpoint, sections[0]))
+    # sorted by path with a trailing separator, the mountpoints nested into
+    # another one follow it
+    ordered = sorted(mountpoints, key=_directory)
+    for index, mountpoint in enumerate(ordered):
+        for other in ordered[index + 1:]:
+            if not _directory(other).startswith(_directory(mountpoint)):
+                break
+            add(mountpoints[other][0], LINT_NESTED_MOUNTPOINT,
+                '{0} is into the mountpoint of "{1}"'.format(
+                    other, mountpoints[mountpoint][0]))
+    return issues
+
+
+def _lint_config(args):
+    return lint_config(*args)
+
+
+def lint_files(filenames, processes=None, home=None, chunksize=CHUNKSIZE):
+    """
+    Check the rc 'filenames' with lint_config in 'processes' worker
+    processes (by default one per CPU) and yield the list of the issues of
+    every file, in the order of 'filenames'.
+    """
+    filenames = list(filenames)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(filenames) // chunksize + 1))
+    tasks = [(filename, home) for filename in filenames]
+    if processes == 1:
+        for task in tasks:
+            yield _lint_config(task)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for issues in pool.imap(_lint_config, tasks, chunksize):
+            yield issues
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def lint_report(filenames, processes=None, home=None):
+    """
+    Return a dict (ready to be dumped as JSON) with the number of the
+    files checked, of the errors and of the warnings and the list of the
+    issues found into 'filenames' (see lint_files).
+    """
+    filenames = list(filenames)
+    issues = [issue for file_issues in lint_files(filenames, processes, home)
+              for issue in file_issues]
+    return {'files': len(filenames),
+            'errors': sum(1 for issue in issues
+                          if issue.severity == SEVERITY_ERROR),
+            'warnings': sum(1 for issue in issues
+                            if issue.severity == SEVERITY_WARNING),
+            'issues': [issue._asdict() for issue in issues]}
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import errno
+import logging
+import os
+import os.path
+import select
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+from pygmount.core.mtab import read_mount_table, index_by_mountpoint
+from pygmount.core.reconcile import reconcile_action, ACTION_NOOP
+from pygmount.core.samba import (run_command, MAX_WORKERS,
+                                 UMOUNT_COMMAND_NAME)
+
+
+SMB_PORT = 445
+PROBE_TIMEOUT = 2.0
+DEBOUNCE = 2.0
+
+REASON_NETWORK = 'network'
+REASON_RESUME = 'resume'
+REASON_TRIGGER = 'trigger'
+
+# rtnetlink multicast groups: links, IPv4/IPv6 addresses and routes
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+NETLINK_GROUPS = (RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE |
+                  RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE)
+
+LOGIND_MONITOR_COMMAND = ['gdbus', 'monitor', '--system', '--dest',
+                          'org.freedesktop.login1', '--object-path',
+                          '/org/freedesktop/login1']
+RESUME_SIGNAL = 'PrepareForSleep (false,)'
+
+logger = logging.getLogger(__name__)
+
+
+def default_trigger_file():
+    """
+    Return the path of the local trigger socket of the current user.
+    """
+    directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(directory,
+                        'pygmount-{0}.trigger'.format(os.getuid()))
+
+
+def send_trigger(trigger_file=None):
+    """
+    Ask a running listener to remount the shares.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(REASON_TRIGGER.encode('ascii'),
+                    trigger_file or default_trigger_file())
+    finally:
+        sock.close()
+
+
+def server_address(wrapper):
+    """
+    Return a tuple with the server of a wrapper (of its source for a bind
+    mount) and the SMB port it is mounted from.
+    """
+    wrapper = getattr(wrapper, 'source', wrapper)
+    return wrapper.server, int(wrapper['port'] if 'port' in wrapper
+                               else SMB_PORT)
+
+
+def probe_servers(servers, port=SMB_PORT, timeout=PROBE_TIMEOUT):
+    """
+    Try concurrently a TCP connection to the SMB port of every server and
+    return the set of the servers that answered within 'timeout' seconds.
+    A server can also be a (server, port) tuple, e.g. of server_address.
+    """
+    reachable = set()
+    lock = threading.Lock()
+
+    def probe(server):
+        address = server if isinstance(server, tuple) else (server, port)
+        try:
+            connection = socket.create_connection(address, timeout)
+        except (socket.error, socket.timeout, OSError):
+            return
+        connection.close()
+        with lock:
+            reachable.add(server)
+
+    threads = [threading.Thread(target=probe, args=(server,))
+               for server in set(servers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    deadline = time.time() + timeout
+    for thread in threads:
+        thread.join(max(0, deadline - time.time()))
+    with lock:
+        return set(reachable)
+
+
+def alive_paths(paths, timeout=PROBE_TIMEOUT):
+    """
+    Call statvfs concurrently on every path and return the set of the paths
+    that answered within 'timeout' seconds (in all) without an error. The
+    dead CIFS mounts left by a suspend or a network change either hang or
+    fail.
+    """
+    alive = set()
+    lock = threading.Lock()
+
+    def check(path):
+        try:
+            os.statvfs(path)
+        except OSError:
+            return
+        with lock:
+            alive.add(path)
+
+    threads = [threading.Thread(target=check, args=(path,))
+               for path in set(paths)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    deadline = time.time() + timeout
+    for thread in threads:
+        thread.join(max(0, deadline - time.time()))
+    with lock:
+        return set(alive)
+
+
+def is_alive(path, timeout=PROBE_TIMEOUT):
+    """
+    Return False if the mount of 'path' is dead (see alive_paths).
+    """
+    return path in alive_paths([path], timeout)
+
+
+def refresh_shares(mss, max_workers=MAX_WORKERS, timeout=PROBE_TIMEOUT):
+    """
+    Remount, after a network change or a resume, the shares of the servers
+    that are reachable now and whose mount is missing, dead or different
+    from the configuration (the reconcile diff). Dead mounts are lazily
+    unmounted first. The shares of unreachable servers are left alone.
+    Return the RunReport of the remount.
+    """
+    entries = index_by_mountpoint(read_mount_table())
+    reachable = probe_servers(
+        [server_address(share.wrapper) for share in mss.shares],
+        timeout=timeout)
+    shares = [share for share in mss.shares
+              if server_address(share.wrapper) in reachable]
+    # one concurrent statvfs round for all the mounts, not one per share
+    alive = alive_paths([share.wrapper.mountpoint for share in shares
+                         if share.wrapper.mountpoint in entries], timeout)
+    selected = []
+    for share in shares:
+        wrapper = share.wrapper
+        entry = entries.get(wrapper.mountpoint)
+        if entry is not None and wrapper.mountpoint not in alive:
+            run_command([UMOUNT_COMMAND_NAME, '-l', wrapper.mountpoint])
+            selected.append(share)
+        elif reconcile_action(wrapper, entry) != ACTION_NOOP:
+            selected.append(share)
+    logger.info('Remounting %s of %s shares (reachable servers: %s)',
+                len(selected), len(mss.shares),
+                ', '.join('{0}:{1}'.format(*address)
+                          for address in sorted(reachable)))
+    return mss.mount_shares(max_workers, shares=selected)
+
+
+class Listener(object):
+    """
+    Wait for the events after which the mounts of the shares may be dead or
+    possible again: rtnetlink link/address/route changes, the resume from
+    sleep signalled by logind and the datagrams sent to a local trigger
+    socket (see send_trigger). Bursts of events are merged in a single one
+    after 'debounce' seconds of quiet.
+    """
+
+    def __init__(self, debounce=DEBOUNCE, trigger_file=None, netlink=True,
+                 logind=True):
+        self.debounce = debounce
+        self.trigger_file = trigger_file or default_trigger_file()
+        self.netlink = netlink
+        self.logind = logind
+        self._sources = {}
+        self._monitor = None
+
+    def open(self):
+        if self.netlink and hasattr(socket, 'AF_NETLINK'):
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                 socket.NETLINK_ROUTE)
+            sock.bind((0, NETLINK_GROUPS))
+            self._sources[sock.fileno()] = (REASON_NETWORK, sock)
+        if self.logind:
+            try:
+                self._monitor = subprocess.Popen(
+                    LOGIND_MONITOR_COMMAND, stdout=subprocess.PIPE,
+                    stderr=open(os.devnull, 'w'))
+            except OSError as e:
+                logger.warning('logind signals not available: %s', e)
+            else:
+                self._sources[self._monitor.stdout.fileno()] = (
+                    REASON_RESUME, self._monitor.stdout)
+        if os.path.exists(self.trigger_file):
+            os.remove(self.trigger_file)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.trigger_file)
+        os.chmod(self.trigger_file, 0o600)
+        self._sources[sock.fileno()] = (REASON_TRIGGER, sock)
+        return self
+
+    def close(self):
+        for reason, source in self._sources.values():
+            source.close()
+        self._sources = {}
+        if self._monitor is not None:
+            self._monitor.terminate()
+            self._monitor.wait()
+            self._monitor = None
+        if os.path.exists(self.trigger_file):
+            os.remove(self.trigger_file)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read(self, fd):
+        """
+        Consume the data of a ready source and return the reason of its
+        event, or None if the data does not ask for a remount.
+        """
+        reason, source = self._sources[fd]
+        if reason == REASON_RESUME:
+            line = source.readline()
+            if not line:
+                del self._sources[fd]
+                return None
+            return reason if RESUME_SIGNAL in line.decode(
+                'utf-8', 'replace') else None
+        try:
+            source.recv(65536)
+        except socket.error as e:
+            # ENOBUFS: the kernel dropped events, still a network change
+            if e.errno != errno.ENOBUFS:
+                raise
+        return reason
+
+    def wait(self, timeout=None):
+        """
+        Wait for an event and for the following quiet period. Return the
+        set of the reasons of the merged events, empty on timeout.
+        """
+        reasons = set()
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if reasons:
+                wait = self.debounce
+            elif deadline is not None:
+                wait = max(0, deadline - time.time())
+            else:
+                wait = None
+            ready = select.select(list(self._sources), [], [], wait)[0]
+            if not ready:
+                return reasons
+            for fd in ready:
+                reason = self._read(fd)
+                if reason is not None:
+                    reasons.add(reason)
+
+    def serve_forever(self, callback):
+        """
+        Call 'callback(reasons)' after every (debounced) event.
+        """
+        while True:
+            reasons = self.wait()
+            if reasons:
+                callback(reasons)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    QueueHandler = QueueListener = None
+
+
+LOG_FILE = '~/.pygmount.log'
+# records waiting to be written, the next ones are dropped
+QUEUE_SIZE = 10000
+MAX_BYTES = 1024 * 1024
+BACKUP_COUNT = 3
+FILE_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+STREAM_FORMAT = logging.BASIC_FORMAT
+
+# LogQueues with a running listener thread, stopped before a fork and
+# started again after it in both processes
+_started = set()
+_started_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format a record as a JSON object on one line (JSON lines).
+    """
+
+    def format(self, record):
+        data = {'time': self.formatTime(record),
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage()}
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, sort_keys=True)
+
+
+if QueueHandler is not None:
+    class DroppingQueueHandler(QueueHandler):
+        """
+        QueueHandler that never blocks: when the queue is full the record is
+        dropped and counted into 'dropped'.
+        """
+
+        def __init__(self, records):
+            QueueHandler.__init__(self, records)
+            self.dropped = 0
+
+        def enqueue(self, record):
+            # called by handle() holding the lock of the handler
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    class DrainingQueueListener(QueueListener):
+        """
+        QueueListener that can be stopped while the queue is full: the stop
+        waits for room instead of failing.
+        """
+
+        def enqueue_sentinel(self):
+            self.queue.put(self._sentinel)
+
+        def handle(self, record):
+            # the levels of the handlers are respected also before Python
+            # 3.5, where QueueListener has no respect_handler_level
+            record = self.prepare(record)
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+class LogQueue(object):
+    """
+    Logging of 'logger' through a bounded queue: the records are only
+    enqueued by the threads that log, while a QueueListener thread writes
+    them to the 'handlers', so that slow storage (e.g. a home directory on
+    a network filesystem) never delays the caller. Without QueueHandler
+    (Python 2) the handlers are added to 'logger' as they are.
+    """
+
+    def __init__(self, handlers, logger=None, queue_size=QUEUE_SIZE):
+        self.handlers = list(handlers)
+        self.logger = logger if logger is not None else logging.getLogger()
+        self.handler = self.listener = None
+        self.started = False
+        if QueueHandler is not None:
+            self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+            self.listener = DrainingQueueListener(self.handler.queue,
+                                                  *self.handlers)
+
+    @property
+    def dropped(self):
+        return self.handler.dropped if self.handler is not None else 0
+
+    def start(self):
+        self.started = True
+        if self.listener is None:
+            for handler in self.handlers:
+                self.logger.addHandler(handler)
+            return
+        self.listener.start()
+        with _started_lock:
+            _started.add(self)
+        self.logger.addHandler(self.handler)
+
+    def stop(self):
+        """
+        Write the records still in the queue (and a warning with the number
+        of the dropped ones, if any), then close the handlers.
+        """
+        if not self.started:
+            return
+        self.started = False
+        if self.listener is not None:
+            self.logger.removeHandler(self.handler)
+            with _started_lock:
+                _started.discard(self)
+                self.listener.stop()
+            if self.dropped:
+                record = self.logger.makeRecord(
+                    self.logger.name, logging.WARNING, __file__, 0,
+                    '%s log records dropped, logging queue full',
+                    (self.dropped,), None)
+                for handler in self.handlers:
+                    handler.handle(record)
+        for handler in self.handlers:
+            if self.listener is None:
+                self.logger.removeHandler(handler)
+            handler.close()
+
+
+def _stop_listeners():
+    # the thread of a listener does not survive a fork: stop it holding the
+    # lock, so that no queue or handler lock is held while forking
+    _started_lock.acquire()
+    for log_queue in _started:
+        log_queue.listener.stop()
+
+
+def _start_listeners():
+    # in the child the lock is still held by the thread that forked, the
+    # only one left
+    for log_queue in _started:
+        log_queue.listener.start()
+    _started_lock.release()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_stop_listeners,
+                        after_in_parent=_start_listeners,
+                        after_in_child=_start_listeners)
+
+
+def reset_logging():
+    """
+    Stop the LogQueues started so far and remove every handler of the root
+    logger, e.g. in a forked process that can't use the ones of its parent.
+    """
+    with _started_lock:
+        log_queues = list(_started)
+    for log_queue in log_queues:
+        log_queue.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+
+def setup_logging(filename=None, level=logging.INFO, json_lines=False,
+                  stream=None, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT,
+                  queue_size=QUEUE_SIZE, stream_level=None):
+    """
+    Log the records of the root logger from 'level' up to the file
+    'filename' (rotated when it reaches 'max_bytes', keeping 'backup_count'
+    old files), as JSON lines with 'json_lines', and/or to 'stream' (from
+    'stream_level' up if given), through a LogQueue of 'queue_size'
+    records. Return the started LogQueue, that is stopped at exit.
+    """
+    handlers = []
+    if filename is not None:
+        # opened by the listener thread at the first record
+        handler = logging.handlers.RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count,
+            delay=True)
+        handler.setLevel(level)
+        handler.setFormatter(JsonFormatter() if json_lines
+                             else logging.Formatter(FILE_FORMAT))
+        handlers.append(handler)
+    if stream is not None:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JsonFormatter() if json_lines
+                             else logging.Formatter(STREAM_FORMAT))
+        if stream_level is not None:
+            handler.setLevel(stream_level)
+            level = min(level, stream_level)
+        handlers.append(handler)
+    log_queue = LogQueue(handlers, queue_size=queue_size)
+    log_queue.logger.setLevel(level)
+    log_queue.start()
+    atexit.register(log_queue.stop)
+    return log_queue
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import io
+import re
+
+
+MOUNT_TABLE_FILE = '/proc/mounts'
+
+MountEntry = collections.namedtuple(
+    'MountEntry', ['service', 'mountpoint', 'filesystem_type', 'options'])
+
+_OCTAL_ESCAPE = re.compile(r'\\([0-7]{3})')
+
+
+def _unescape(field):
+    """
+    Decode the octal escapes (e.g. '\\040' for a space) used by the kernel
+    into the fields of the mount table.
+    """
+    return _OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), field)
+
+
+def parse_options(text):
+    """
+    Parse a comma separated string of mount options into an ordered dict.
+    Flag options (without '=') are mapped to None.
+    """
+    options = collections.OrderedDict()
+    for option in text.split(','):
+        if not option:
+            continue
+        key, sep, value = option.partition('=')
+        options[key] = value if sep else None
+    return options
+
+
+def read_mount_table(filename=MOUNT_TABLE_FILE, filesystem_type=None):
+    """
+    Read the mount table and return a list of MountEntry. If filesystem_type
+    is given only the entries of that type are returned.
+    """
+    entries = []
+    with io.open(filename, encoding='utf-8', errors='replace') as table:
+        for line in table:
+            fields = line.split()
+            if len(fields) < 4:
+                continue
+            if filesystem_type and fields[2] != filesystem_type:
+                continue
+            entries.append(MountEntry(_unescape(fields[0]),
+                                      _unescape(fields[1]),
+                                      fields[2],
+                                      parse_options(fields[3])))
+    return entries
+
+
+def index_by_mountpoint(entries):
+    """
+    Return a dict mountpoint -> MountEntry. When a mountpoint is stacked the
+    last (visible) entry wins, as in the kernel.
+    """
+    return dict((entry.mountpoint, entry) for entry in entries)
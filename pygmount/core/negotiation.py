@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import errno
+import threading
+import time
+
+from pygmount.core.breaker import mount_error_codes
+from pygmount.core.mtab import parse_options
+from pygmount.core.store import ServerStore
+
+
+NEGOTIATION_FILE = '~/.pygmount.dialects.json'
+# SMB1 ('1.0') is insecure and never negotiated unless a share asks for it
+# with 'dialects' or 'vers'
+DEFAULT_DIALECTS = '3.1.1; 3.0; 2.1; 2.0'
+
+# errors of mount.cifs for a dialect or option set refused by the server;
+# the network ones (e.g. EHOSTDOWN) go to the circuit breaker instead
+NEGOTIATION_ERRORS = frozenset([errno.EOPNOTSUPP, errno.EINVAL,
+                                errno.EPROTONOSUPPORT])
+
+
+def parse_dialects(value):
+    """
+    Parse a ';' separated list of candidate option sets, where every option
+    set is either a bare SMB version (e.g. '3.0') or comma separated mount
+    options (e.g. 'vers=3.0,seal'). Return a list of ordered dicts.
+    """
+    candidates = []
+    for item in value.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        if '=' not in item and ',' not in item:
+            candidates.append(collections.OrderedDict([('vers', item)]))
+        else:
+            candidates.append(parse_options(item))
+    return candidates
+
+
+def is_negotiation_failure(output):
+    """
+    Return True if the output of a failed mount says that the server did not
+    accept the protocol dialect or the options.
+    """
+    return any(code in NEGOTIATION_ERRORS
+               for code in mount_error_codes(output))
+
+
+class DialectCache(ServerStore):
+    """
+    Local cache of the dialect/option set that worked for every server,
+    with the latency of the mount that found it.
+    """
+
+    def __init__(self, filename=NEGOTIATION_FILE):
+        super(DialectCache, self).__init__(filename)
+        self._server_locks = collections.defaultdict(threading.Lock)
+
+    def lock(self, server):
+        """
+        Return the lock to hold while negotiating with 'server', so that the
+        candidates are tried only once even with concurrent mounts.
+        """
+        with self._lock:
+            return self._server_locks[server]
+
+    def get(self, server):
+        with self._lock:
+            data = self._servers.get(server)
+            return (collections.OrderedDict(data['options'])
+                    if data else None)
+
+    def set(self, server, options, latency):
+        with self._lock:
+            self._servers[server] = {'options': list(options.items()),
+                                     'latency': round(latency, 3),
+                                     'timestamp': time.time()}
+
+    def discard(self, server):
+        with self._lock:
+            self._servers.pop(server, None)
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import copy
+import errno
+import getpass
+import logging
+import os
+import os.path
+import threading
+import time
+
+from pygmount.core.breaker import ACTION_CIRCUIT_OPEN
+from pygmount.core.listener import probe_servers, server_address
+from pygmount.core.mtab import read_mount_table, index_by_mountpoint
+from pygmount.core.reconcile import (reconcile_action, ACTION_NOOP,
+                                     ACTION_MOUNT)
+from pygmount.core.report import MountResult, RunReport
+from pygmount.core import samba
+from pygmount.core.samba import (run_command, MountBindWrapper,
+                                 InstallRequiredPackageError, MAX_WORKERS)
+
+
+STAGE_REQUIREMENTS = 'requirements'
+STAGE_CONFIG = 'config'
+STAGE_CREDENTIALS = 'credentials'
+STAGE_MOUNT = 'mount'
+STAGE_REPORT = 'report'
+STAGE_RESOLVE = 'resolve'
+STAGE_MKDIR = 'mkdir'
+STAGE_HOOK_PRE = 'hook_pre'
+STAGE_HOOK_POST = 'hook_post'
+STAGE_PLAN = 'plan'
+
+ACTION_UNREACHABLE = 'unreachable'
+ACTION_MKDIR_FAILED = 'mkdir-failed'
+ACTION_HOOK_FAILED = 'hook-failed'
+
+EXIT_OK = 0
+EXIT_REQUIREMENTS = 1
+EXIT_CREDENTIALS = 2
+EXIT_FAILED = 4
+EXIT_CONFIG = 5
+EXIT_REQUIREMENTS_ERROR = 21
+
+PROBE_TIMEOUT = 2.0
+PASSWORD_MASK = '******'
+
+logger = logging.getLogger(__name__)
+
+# A stage of the run ('function(mss, run)') or of every share
+# ('function(mss, share, context, result)', see run_share).
+Stage = collections.namedtuple('Stage', ['name', 'function'])
+
+
+class PipelineError(Exception):
+    """
+    Raised by a stage to stop the run with the exit code 'returncode'.
+    """
+
+    def __init__(self, msg, returncode):
+        super(PipelineError, self).__init__(msg)
+        self.returncode = returncode
+
+
+def _result(share, action, returncode, output=None):
+    wrapper = share.wrapper
+    return MountResult(share.name, wrapper.server, wrapper.service,
+                       wrapper.mountpoint, action, returncode, output, 0.0,
+                       {})
+
+
+# stages of every share
+
+def resolve_stage(mss, share, context, result):
+    """
+    Resolve the server and probe its SMB port (the 'port' of the share or
+    445), once per server and port for the whole run, so that the shares
+    of an unreachable server fail at once instead of waiting for the
+    timeout of mount.cifs. With a circuit breaker the servers with an open
+    circuit are not probed and a failed probe counts as a network failure.
+    """
+    if isinstance(share.wrapper, MountBindWrapper):
+        return None
+    server = share.wrapper.server
+    address = server_address(share.wrapper)
+    breaker = mss.breaker
+    with context['lock']:
+        probe = context['probes'].setdefault(address, {
+            'lock': threading.Lock(), 'reachable': None, 'open': False})
+    with probe['lock']:
+        if probe['reachable'] is None:
+            if breaker is not None and not breaker.allow(server):
+                probe['reachable'], probe['open'] = False, True
+            else:
+                probe['reachable'] = bool(probe_servers(
+                    [address], timeout=context.get('probe_timeout',
+                                                   PROBE_TIMEOUT)))
+                if breaker is not None and probe['reachable']:
+                    # the half-open probe (if taken) goes to the mount
+                    breaker.release(server)
+                elif breaker is not None:
+                    breaker.record(server, False)
+    if probe['open']:
+        return _result(share, ACTION_CIRCUIT_OPEN, errno.EHOSTDOWN)
+    if not probe['reachable']:
+        return _result(share, ACTION_UNREACHABLE, errno.EHOSTUNREACH,
+                       'server {0} unreachable'.format(server))
+    return None
+
+
+def mkdir_stage(mss, share, context, result):
+    """
+    Create the mountpoint of the share if it does not exist.
+    """
+    mountpoint = share.wrapper.mountpoint
+    try:
+        os.makedirs(mountpoint)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(mountpoint):
+            return _result(share, ACTION_MKDIR_FAILED, e.errno, str(e))
+    return None
+
+
+def hook_pre_stage(mss, share, context, result):
+    """
+    Run the 'hook_pre_command' of the share; if it fails the share is not
+    mounted. Hooks are split into arguments and run without a shell: use
+    "sh -c '...'" for pipes and redirections.
+    """
+    if not share.hook_pre_command:
+        return None
+    returncode, output = run_command(share.hook_pre_command)
+    if returncode != 0:
+        return _result(share, ACTION_HOOK_FAILED, returncode, output)
+    return None
+
+
+def mount_stage(mss, share, context, result):
+    return mss.mount_share(share, context['mount_table'],
+                           context.get('limiter'), context.get('start'))
+
+
+def hook_post_stage(mss, share, context, result):
+    """
+    Run the 'hook_post_command' of a mounted share. A failure is logged but
+    does not change the result of the mount.
+    """
+    if not share.hook_post_command:
+        return None
+    returncode, output = run_command(share.hook_post_command)
+    if returncode != 0:
+        logger.warning('hook_post_command of "%s" failed (%s): %s',
+                       share.name, returncode, output)
+    return None
+
+
+def plan_stage(mss, share, context, result):
+    """
+    Dry run: return the action that the mount would take, with the command
+    (password masked) as output, without running anything.
+    """
+    wrapper = share.wrapper
+    entry = index_by_mountpoint(context['mount_table']).get(
+        wrapper.mountpoint)
+    if isinstance(wrapper, MountBindWrapper):
+        action = ACTION_NOOP if entry is not None else ACTION_MOUNT
+    else:
+        action = reconcile_action(wrapper, entry)
+        if 'password' in wrapper:
+            wrapper = copy.copy(wrapper)
+            wrapper.options = wrapper._options
+            wrapper['password'] = PASSWORD_MASK
+    return _result(share, action, 0,
+                   None if action == ACTION_NOOP else wrapper.command)
+
+
+SHARE_STAGES = (Stage(STAGE_RESOLVE, resolve_stage),
+                Stage(STAGE_MKDIR, mkdir_stage),
+                Stage(STAGE_HOOK_PRE, hook_pre_stage),
+                Stage(STAGE_MOUNT, mount_stage),
+                Stage(STAGE_HOOK_POST, hook_post_stage))
+DRY_RUN_SHARE_STAGES = (Stage(STAGE_PLAN, plan_stage),)
+
+
+def run_share(mss, share, stages, context):
+    """
+    Pass 'share' through the share 'stages' in order, timing each of them
+    into the phases of the result. A stage returns a MountResult (or None
+    to keep the current one); after a failed result the remaining stages
+    are skipped. Return the final MountResult.
+    """
+    result = None
+    timings = collections.OrderedDict()
+    for stage in stages:
+        start = time.time()
+        outcome = stage.function(mss, share, context, result)
+        timings[stage.name] = time.time() - start
+        if outcome is not None:
+            result = outcome
+        if result is not None and result.returncode != 0:
+            break
+    if result is None:
+        result = _result(share, ACTION_NOOP, 0)
+    phases = dict(result.phases)
+    for name, elapsed in timings.items():
+        phases.setdefault(name, elapsed)
+    return result._replace(phases=phases)
+
+
+# stages of the run
+
+def requirements_stage(mss, run):
+    """
+    Install the required apt packages that are missing.
+    """
+    if not mss.required_packages:
+        return
+    if samba.apt is None:
+        logger.warning('python-apt not available, required packages not'
+                       ' checked: %s', ', '.join(mss.required_packages))
+        return
+    for package in mss.required_packages:
+        try:
+            mss.install_apt_package(package)
+        except InstallRequiredPackageError as irpe:
+            if isinstance(irpe.source, samba.apt.LockFailedException):
+                raise PipelineError(str(irpe), EXIT_REQUIREMENTS)
+            raise PipelineError(str(irpe), EXIT_REQUIREMENTS_ERROR)
+
+
+def config_stage(mss, run):
+    """
+    Read the shares (only the ones selected by the pipeline, if any) from
+    the configuration file, if not already set.
+    """
+    if mss.shares is not None:
+        return
+    if not os.path.exists(mss.config_file):
+        raise PipelineError(
+            'Impossibile trovare il file di configurazione "{0}".\nLe unità'
+            ' di rete non saranno collegate.'.format(mss.config_file),
+            EXIT_CONFIG)
+    try:
+        mss.set_shares(only=run.only, tags=run.tags)
+    except ValueError as e:
+        raise PipelineError(
+            'Errore nel file di configurazione "{0}": {1}'.format(
+                mss.config_file, e), EXIT_CONFIG)
+
+
+def credentials_stage(mss, run):
+    """
+    Ask the credentials with 'mss.credentials_prompt' if some share needs
+    them and has none, and give them to those shares.
+    """
+    if mss.credentials_prompt is None:
+        return
+    missing = [share for share in mss.shares
+               if not isinstance(share.wrapper, MountBindWrapper) and
+               'username' not in share.wrapper.personal_credentials and
+               not (share.wrapper.multiuser and
+                    share.wrapper['sec'].startswith('krb5'))]
+    if not missing:
+        return
+    # under sudo the default is the user that called it, not root
+    credentials = mss.credentials_prompt(
+        None, os.environ.get('SUDO_USER') or getpass.getuser())
+    if not credentials or not all(credentials):
+        raise PipelineError('Credenziali di dominio non inserite.',
+                            EXIT_CREDENTIALS)
+    mss.set_credentials(*credentials)
+
+
+def mount_stage_run(mss, run):
+    """
+    Mount the shares passing every share through the share stages, within
+    the time budget if any.
+    """
+    if run.budget is None:
+        run.report = mss.mount_shares(run.max_workers, run.limiter,
+                                      stages=run.share_stages)
+    else:
+        run.report = mss.mount_shares_in_budget(
+            run.budget, run.max_workers, run.limiter,
+            stages=run.share_stages)
+
+
+def plan_stage_run(mss, run):
+    """
+    Dry run of the mount stage: pass every share through the share stages
+    (by default only the plan) without the mount engine, so that nothing
+    is mounted or recorded.
+    """
+    report = RunReport()
+    context = {'mount_table': read_mount_table(), 'probes': {},
+               'lock': threading.Lock()}
+    for share in mss.shares:
+        report.add(run_share(mss, share, run.share_stages, context))
+    report.finish()
+    run.report = report
+
+
+def report_stage(mss, run):
+    """
+    Log the outcome of the run and set the exit code.
+    """
+    report = run.report
+    for result in report.failed:
+        logger.error('Share "%s" not mounted (%s, %s): %s', result.name,
+                     result.action, result.returncode, result.output)
+    if report.pending:
+        logger.info('Shares still mounting in background: %s',
+                    ', '.join(report.pending))
+    for server, limit in sorted((report.limits or {}).items()):
+        logger.info('Server "%s": limit %s, %s mounts, latency %ss, %.0f%% '
+                    'failed', server, limit['limit'], limit['mounts'],
+                    limit['latency'], limit['failure_rate'] * 100)
+    logger.info('%s shares processed in %.2fs, %s failed',
+                len(report.results), report.duration, len(report.failed))
+    if report.failed:
+        run.returncode = EXIT_FAILED
+
+
+RUN_STAGES = (Stage(STAGE_REQUIREMENTS, requirements_stage),
+              Stage(STAGE_CONFIG, config_stage),
+              Stage(STAGE_CREDENTIALS, credentials_stage),
+              Stage(STAGE_MOUNT, mount_stage_run),
+              Stage(STAGE_REPORT, report_stage))
+
+
+class Pipeline(object):
+    """
+    A mount run as an explicit sequence of timed stages: the run 'stages'
+    (requirements, config, credentials, mount, report) are done once, while
+    the 'share_stages' (resolve, mkdir, hooks and mount) are done for every
+    share as soon as it enters the worker pool, so that the shares flow
+    through them independently of each other. Stages can be replaced,
+    removed or added (see Stage). With 'dry_run' nothing is installed,
+    asked or mounted: the shares are only planned. 'only' and 'tags' select
+    the shares to read (see MountSmbShares.set_shares).
+    """
+
+    def __init__(self, stages=RUN_STAGES, share_stages=None, dry_run=False,
+                 max_workers=MAX_WORKERS, limiter=None, budget=None,
+                 only=None, tags=None):
+        if dry_run:
+            stages = [Stage(STAGE_MOUNT, plan_stage_run)
+                      if stage.name == STAGE_MOUNT else stage
+                      for stage in stages if stage.name not in (
+                          STAGE_REQUIREMENTS, STAGE_CREDENTIALS)]
+        self.stages = list(stages)
+        if share_stages is None:
+            share_stages = DRY_RUN_SHARE_STAGES if dry_run else SHARE_STAGES
+        self.share_stages = list(share_stages)
+        self.max_workers = max_workers
+        self.limiter = limiter
+        self.budget = budget
+        self.only = only
+        self.tags = tags
+        self.report = None
+        self.returncode = EXIT_OK
+        self.error = None
+        self.timings = collections.OrderedDict()
+
+    def run(self, mss):
+        """
+        Run the stages on 'mss' in order, until one raises PipelineError
+        (kept in 'self.error'). Return the exit code; the RunReport (with
+        the time of every stage in 'stages') is in 'self.report'.
+        """
+        try:
+            for stage in self.stages:
+                start = time.time()
+                try:
+                    stage.function(mss, self)
+                finally:
+                    self.timings[stage.name] = round(time.time() - start, 3)
+        except PipelineError as e:
+            logger.error('Stage "%s" failed: %s', stage.name, e)
+            self.error = e
+            self.returncode = e.returncode
+        if self.report is not None:
+            self.report.stages = dict(self.timings)
+        return self.returncode
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import functools
+import os
+import shlex
+import subprocess
+import threading
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+# bytes of the most recent output kept for every command
+OUTPUT_LIMIT = 64 * 1024
+# launch the commands with posix_spawn (vfork + exec with glibc), that
+# doesn't copy the page tables of a large parent like fork does
+USE_POSIX_SPAWN = hasattr(os, 'posix_spawnp')
+
+
+def split_command(command):
+    """
+    Return the argv list of 'command', a list or a string with the quoting
+    rules of a POSIX shell (but without any expansion, pipe or redirection).
+    """
+    if isinstance(command, (list, tuple)):
+        return list(command)
+    if isinstance(command, bytes):
+        command = command.decode('utf-8')
+    return shlex.split(command)
+
+
+def join_command(args):
+    """
+    Return the string of the argv list 'args', quoted so that split_command
+    gives it back.
+    """
+    return ' '.join(quote(arg) for arg in args)
+
+
+class OutputBuffer(object):
+    """
+    Thread-safe ring buffer of the last 'limit' bytes of output, kept as
+    whole lines: the oldest lines are dropped to make room for new ones.
+    """
+
+    def __init__(self, limit=OUTPUT_LIMIT):
+        self.limit = limit
+        self.size = 0
+        self.dropped = 0
+        self._lines = collections.deque()
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            line = line[-self.limit:]
+            self._lines.append(line)
+            self.size += len(line)
+            while self.size > self.limit:
+                self.size -= len(self._lines.popleft())
+                self.dropped += 1
+
+    def getvalue(self):
+        with self._lock:
+            return b''.join(self._lines)
+
+
+def _spawn(args):
+    """
+    Launch 'args' with os.posix_spawnp, stdin from /dev/null and stdout and
+    stderr to new pipes. Return the pid and the read ends of the pipes.
+    """
+    out_read, out_write = os.pipe()
+    err_read, err_write = os.pipe()
+    try:
+        pid = os.posix_spawnp(args[0], args, os.environ, file_actions=[
+            (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+            (os.POSIX_SPAWN_DUP2, out_write, 1),
+            (os.POSIX_SPAWN_DUP2, err_write, 2)])
+    except OSError:
+        os.close(out_read)
+        os.close(err_read)
+        raise
+    finally:
+        os.close(out_write)
+        os.close(err_write)
+    return pid, os.fdopen(out_read, 'rb'), os.fdopen(err_read, 'rb')
+
+
+def _wait(pid):
+    """
+    Reap the child 'pid' and return its return code, negative for a signal
+    as subprocess does.
+    """
+    status = os.waitpid(pid, 0)[1]
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _popen(args):
+    with open(os.devnull, 'rb') as devnull:
+        process = subprocess.Popen(args, stdin=devnull,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, close_fds=True)
+    return process.wait, process.stdout, process.stderr
+
+
+def _drain(pipe, buffer, name, stream):
+    # a line longer than the buffer is read in chunks of its size, so that
+    # an output without newlines never grows in memory
+    with pipe:
+        for line in iter(lambda: pipe.readline(buffer.limit), b''):
+            buffer.append(line)
+            if stream is not None:
+                stream.info('%s: %s', name,
+                            line.decode('utf-8', 'replace').rstrip('\n'))
+
+
+def execute(command, limit=OUTPUT_LIMIT, stream=None, posix_spawn=None):
+    """
+    Run 'command' (an argv list, or a string split by split_command) without
+    a shell. stdout and stderr are drained concurrently while the command
+    runs, so that a verbose command can't block on a full pipe, and only the
+    last 'limit' bytes of their output are kept. With a logger as 'stream'
+    every line is logged as soon as it arrives. Return a tuple with return
+    code and output (bytes, stdout and stderr interleaved).
+    The command is launched with posix_spawn where available (see
+    USE_POSIX_SPAWN, overridden by 'posix_spawn'), otherwise by subprocess.
+    """
+    args = split_command(command)
+    if posix_spawn is None:
+        posix_spawn = USE_POSIX_SPAWN
+    try:
+        if posix_spawn:
+            pid, stdout, stderr = _spawn(args)
+            wait = functools.partial(_wait, pid)
+        else:
+            wait, stdout, stderr = _popen(args)
+    except OSError as e:
+        return 127, '{0}: {1}'.format(args[0], e.strerror).encode('utf-8')
+    buffer = OutputBuffer(limit)
+    readers = [threading.Thread(target=_drain,
+                                args=(pipe, buffer, args[0], stream))
+               for pipe in (stdout, stderr)]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+    returncode = wait()
+    for reader in readers:
+        reader.join()
+    if buffer.dropped and stream is not None:
+        stream.warning('%s: %s lines of output dropped', args[0],
+                       buffer.dropped)
+    return returncode, buffer.getvalue()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import, division
+
+import collections
+import os
+import os.path
+import shutil
+import tempfile
+import time
+
+from pygmount.core.bench import sequential_write, sequential_read
+from pygmount.core.store import ServerStore
+
+
+TUNING_FILE = '~/.pygmount.tuning.json'
+PROFILE_AUTO = 'auto'
+PROFILE_DEFAULT = 'default'
+MEASURE_SIZE = 16 * 1024 * 1024
+MEASURE_BLOCK = 1024 * 1024
+
+# Named sets of CIFS options tuned for a kind of workload. The options of
+# the rc section always override the ones of its profile.
+PROFILES = collections.OrderedDict([
+    # large sequential transfers: biggest buffers and more SMB credits
+    ('bulk', collections.OrderedDict([
+        ('rsize', '4194304'), ('wsize', '4194304'), ('cache', 'strict'),
+        ('max_credits', '64000')])),
+    # many small files: keep attributes and directory entries cached longer
+    ('metadata-heavy', collections.OrderedDict([
+        ('actimeo', '30'), ('cache', 'strict'), ('rsize', '1048576'),
+        ('wsize', '1048576')])),
+    # read-only shares: cache everything, the data can't change under us
+    ('readonly-cache', collections.OrderedDict([
+        ('ro', None), ('cache', 'ro'), ('actimeo', '600'),
+        ('rsize', '4194304')])),
+])
+
+
+def profile_options(name, tuning=None, server=None):
+    """
+    Return the options of the profile 'name'. With the 'auto' profile the
+    options found by the auto-tune of 'server' are returned, if any.
+    Unknown profiles have no options.
+    """
+    if name == PROFILE_AUTO:
+        tuned = tuning.get(server) if tuning is not None else None
+        return collections.OrderedDict(tuned['options'] if tuned else [])
+    return collections.OrderedDict(PROFILES.get(name, {}))
+
+
+def measure_throughput(path, size=MEASURE_SIZE, block=MEASURE_BLOCK):
+    """
+    Write and read back a temporary file of 'size' bytes into 'path' and
+    return the mean of the sequential write and read throughput in MB/s.
+    """
+    directory = tempfile.mkdtemp(prefix='.pygmount-measure-', dir=path)
+    filename = os.path.join(directory, 'data')
+    try:
+        write = sequential_write(filename, size, block)
+        read = sequential_read(filename, block)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return (write + read) / 2
+
+
+class TuningCache(ServerStore):
+    """
+    Local store of the profile that won the auto-tune of every server.
+    """
+
+    def __init__(self, filename=TUNING_FILE):
+        super(TuningCache, self).__init__(filename)
+
+    def get(self, server):
+        with self._lock:
+            return self._servers.get(server)
+
+    def set(self, server, profile, options, scores):
+        with self._lock:
+            self._servers[server] = {'profile': profile,
+                                     'options': list(options.items()),
+                                     'scores': scores,
+                                     'timestamp': time.time()}
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+try:
+    import pwd
+    import grp
+except ImportError:
+    pwd = grp = None
+
+
+ACTION_NOOP = 'noop'
+ACTION_MOUNT = 'mount'
+ACTION_REMOUNT = 'remount'
+ACTION_CYCLE = 'cycle'
+
+# Actions that actually run a mount command, the others skip the share
+MOUNT_ACTIONS = (ACTION_MOUNT, ACTION_REMOUNT, ACTION_CYCLE)
+
+# Options that the cifs module can change with "-o remount" on a live mount,
+# every other difference needs a full umount/mount cycle.
+REMOUNT_OPTIONS = frozenset([
+    'uid', 'gid', 'forceuid', 'noforceuid', 'forcegid', 'noforcegid',
+    'file_mode', 'dir_mode', 'perm', 'noperm', 'setuids', 'nosetuids',
+    'actimeo', 'acregmax', 'acdirmax', 'closetimeo', 'cache', 'rsize',
+    'wsize', 'echo_interval', 'ro', 'rw'])
+
+# Options never shown by the kernel into the mount table: the secrets and
+# the options of mount(8) and of fstab that are not passed to the kernel.
+UNLISTED_OPTIONS = frozenset([
+    'password', 'pass', 'password2', 'credentials', 'cred', 'guest',
+    'nofail', 'noauto', 'auto', '_netdev', 'defaults', 'sloppy', 'exec',
+    'suid', 'dev', 'users'])
+# Prefix of the fstab options for other programs (e.g. x-systemd.*).
+UNLISTED_PREFIX = 'x-'
+
+# Aliases of the options, listed by the kernel with the canonical name.
+OPTION_ALIASES = {'user': 'username', 'dom': 'domain',
+                  'workgroup': 'domain', 'pass': 'password',
+                  'cred': 'credentials'}
+
+# Values that let the kernel pick the option's value, so any live value
+# satisfies them.
+NEGOTIATED_VALUES = {'vers': ('default', '3')}
+
+
+def _normalize(key, value):
+    if value is None:
+        return None
+    if key in ('file_mode', 'dir_mode'):
+        try:
+            return int(value, 8)
+        except ValueError:
+            return value
+    if key == 'uid' and pwd is not None and not value.isdigit():
+        try:
+            return str(pwd.getpwnam(value).pw_uid)
+        except KeyError:
+            return value
+    if key == 'gid' and grp is not None and not value.isdigit():
+        try:
+            return str(grp.getgrnam(value).gr_gid)
+        except KeyError:
+            return value
+    return value
+
+
+def diff_options(configured, live):
+    """
+    Compare the configured options of a share with the options of its live
+    mount and return a dict with the configured options that differ. The
+    aliases of an option are compared by its canonical name, the options
+    the kernel does not list are ignored.
+    """
+    differences = {}
+    live = dict((OPTION_ALIASES.get(key, key), value)
+                for key, value in live.items())
+    for key, value in configured.items():
+        name = OPTION_ALIASES.get(key, key)
+        if name in UNLISTED_OPTIONS or name.startswith(UNLISTED_PREFIX):
+            continue
+        if value in NEGOTIATED_VALUES.get(name, ()) and name in live:
+            continue
+        if name not in live or _normalize(name, value) != _normalize(
+                name, live[name]):
+            differences[key] = value
+    return differences
+
+
+def reconcile_action(wrapper, entry):
+    """
+    Return the action needed to bring the live mount 'entry' (a MountEntry
+    or None if nothing is mounted on the wrapper's mountpoint) in line with
+    the wrapper: ACTION_NOOP, ACTION_MOUNT, ACTION_REMOUNT if only options
+    that the kernel can change in place differ, ACTION_CYCLE otherwise.
+    """
+    if entry is None:
+        return ACTION_MOUNT
+    if wrapper.filesystem_type is None:
+        # bind mounts carry no options of their own
+        return ACTION_NOOP
+    if entry.service.lower() != wrapper.service.lower():
+        return ACTION_CYCLE
+    differences = diff_options(wrapper._options, entry.options)
+    if not differences:
+        return ACTION_NOOP
+    if all(key in REMOUNT_OPTIONS for key in differences):
+        return ACTION_REMOUNT
+    return ACTION_CYCLE
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import time
+
+
+MountResult = collections.namedtuple(
+    'MountResult', ['name', 'server', 'service', 'mountpoint', 'action',
+                    'returncode', 'output', 'duration', 'phases'])
+
+
+def result_to_dict(result):
+    """
+    Return a JSON serializable dict of a MountResult.
+    """
+    data = result._asdict()
+    if isinstance(data['output'], bytes):
+        data['output'] = data['output'].decode('utf-8', 'replace')
+    data['duration'] = round(result.duration, 3)
+    return data
+
+
+def result_from_dict(data):
+    return MountResult(**data)
+
+
+class RunReport(object):
+    """
+    Collect the results of a mount run and the state of the components that
+    drove it (e.g. the concurrency limits per server).
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.results = []
+        self.limits = {}
+        self.circuits = {}
+        self.pending = []
+        self.stages = {}
+        self.coalesced = False
+
+    def add(self, result):
+        self.results.append(result)
+
+    def finish(self):
+        self.finished = time.time()
+
+    @property
+    def failed(self):
+        return [result for result in self.results if result.returncode != 0]
+
+    @property
+    def duration(self):
+        return (self.finished or time.time()) - self.started
+
+    def to_dict(self):
+        return {'started': self.started,
+                'duration': round(self.duration, 3),
+                'results': [result_to_dict(result)
+                            for result in self.results],
+                'limits': self.limits,
+                'circuits': self.circuits,
+                'pending': self.pending,
+                'stages': self.stages}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Return a RunReport from the dict of RunReport.to_dict.
+        """
+        report = cls()
+        report.started = data['started']
+        report.finished = data['started'] + data['duration']
+        report.results = [result_from_dict(result)
+                          for result in data['results']]
+        report.limits = data['limits']
+        report.circuits = data['circuits']
+        report.pending = data['pending']
+        report.stages = data.get('stages', {})
+        return report
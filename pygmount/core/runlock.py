@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import errno
+import fcntl
+import getpass
+import json
+import os
+import os.path
+import pwd
+import time
+
+
+RESULT_TTL = 30
+RUNTIME_DIR = '/run/user/{0}'
+
+
+def default_lock_file(username=None):
+    """
+    Return the path of the run lock of 'username' (by default the user that
+    called sudo, or the current user): into its runtime directory if any,
+    otherwise into its home directory, so that the runs done as root for
+    different users never share a lock.
+    """
+    username = (username or os.environ.get('SUDO_USER') or
+                getpass.getuser())
+    try:
+        uid = pwd.getpwnam(username).pw_uid
+    except KeyError:
+        uid = os.getuid()
+    directory = RUNTIME_DIR.format(uid)
+    if os.path.isdir(directory):
+        return os.path.join(directory, 'pygmount.lock')
+    return os.path.join(os.path.expanduser('~{0}'.format(username)),
+                        '.pygmount.lock')
+
+
+class RunLock(object):
+    """
+    Per-user fcntl lock of the mount runs. A run that starts while another
+    one is in progress waits for it and, if that run stored its result less
+    than 'ttl' seconds before, reuses it instead of mounting everything
+    again.
+    """
+
+    def __init__(self, filename=None, ttl=RESULT_TTL):
+        self.filename = filename or default_lock_file()
+        self.result_file = self.filename + '.result'
+        self.ttl = ttl
+
+    def _load_result(self, arrived):
+        try:
+            with open(self.result_file) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        finished = data.get('finished', 0)
+        if finished < arrived or time.time() - finished > self.ttl:
+            return None
+        return data['result']
+
+    def _store_result(self, result):
+        temporary = '{0}.{1}.tmp'.format(self.result_file, os.getpid())
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'finished': time.time(), 'result': result}, f)
+        os.rename(temporary, self.result_file)
+
+    def run(self, function):
+        """
+        Call 'function' (returning a JSON serializable result) holding the
+        lock. Return a tuple with the result and True if it was coalesced
+        from a concurrent run, False if 'function' was called.
+        """
+        arrived = time.time()
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                result = self._load_result(arrived)
+                if result is not None:
+                    return result, True
+            result = function()
+            self._store_result(result)
+            return result, False
+        finally:
+            os.close(fd)
@@ -2,20 +2,80 @@
 from __future__ import unicode_literals, absolute_import
 
 import collections
+import errno
+import functools
+import json
+import logging
+import os
 import os.path
+import pwd
+import select
 import subprocess
+import tempfile
+import threading
+import time
 try:
     import apt
 except ImportError:
     apt = None
 try:
-    from ConfigParser import ConfigParser
+    from concurrent import futures
 except ImportError:
-    from configparser import ConfigParser
+    futures = None
+try:
+    from ConfigParser import RawConfigParser
+except ImportError:
+    from configparser import RawConfigParser
+
+from pygmount.core.mtab import read_mount_table, index_by_mountpoint
+from pygmount.core.negotiation import (parse_dialects, DEFAULT_DIALECTS,
+                                       is_negotiation_failure)
+from pygmount.core.batch import MountBatch, ACTION_CANCELLED
+from pygmount.core.breaker import is_network_failure, ACTION_CIRCUIT_OPEN
+from pygmount.core.concurrency import AdaptiveLimiter, longest_first
+from pygmount.core.config import read_includes, share_sections, section_items
+from pygmount.core.credentials import (verify_credentials, CHECK_FAILED,
+                                       ACTION_AUTH_FAILED,
+                                       AUTH_FAILED_RETURNCODE)
+from pygmount.core.logs import setup_logging, reset_logging, LOG_FILE
+from pygmount.core.process import execute, quote
+from pygmount.core.profiles import (profile_options, measure_throughput,
+                                    PROFILES, PROFILE_DEFAULT)
+from pygmount.core.reconcile import (reconcile_action, ACTION_NOOP,
+                                     ACTION_MOUNT, ACTION_REMOUNT,
+                                     ACTION_CYCLE)
+from pygmount.core.report import (MountResult, RunReport, result_to_dict,
+                                  result_from_dict)
+from pygmount.core.uri import parse_share_uri
 
 
+MAX_WORKERS = 8
+CREDENTIALS_ATTEMPTS = 3
+PRIORITIES = collections.OrderedDict(
+    [('critical', 0), ('high', 1), ('normal', 2), ('low', 3)])
+DEFAULT_PRIORITY = 'normal'
 MOUNT_COMMAND_NAME = 'mount'
+UMOUNT_COMMAND_NAME = 'umount'
 CIFS_FILESYSTEM_TYPE = 'cifs'
+CIFSCREDS_COMMAND_NAME = 'cifscreds'
+MULTIUSER_SECURITY = 'krb5'
+# sec= of the multiuser mounts: krb5 uses the Kerberos tickets of the
+# users, the ntlmssp ones the credentials stored with cifscreds
+MULTIUSER_SECURITIES = ('krb5', 'krb5i', 'ntlmssp', 'ntlmsspi')
+# host-wide directory of the multiuser mountpoints that are not absolute
+MULTIUSER_ROOT = '/mnt/pygmount'
+BIND_ROOT = '~/.pygmount/mounts'
+PERSONAL_CREDENTIALS = ('username', 'password', 'domain')
+# a bind share not mounted because its source failed
+ACTION_SOURCE_FAILED = 'source-failed'
+
+
+logger = logging.getLogger(__name__)
+
+Share = collections.namedtuple(
+    'Share', ['name', 'wrapper', 'hook_pre_command', 'hook_post_command',
+              'priority', 'dialects'])
+Share.__new__.__defaults__ = (None, None, DEFAULT_PRIORITY, None)
 
 
 class InstallRequiredPackageError(Exception):
@@ -25,21 +85,54 @@ class InstallRequiredPackageError(Exception):
         self.source = source
 
 
-def run_command(command):
+def run_command(command, stream=None):
     """
-    Utility function for run command with subprocess. Return a tuple, with
-    return code and if python >= 2.7 command's output or None if python <= 2.6
+    Run 'command' (an argv list or a string, split as a shell would but
+    never run through one) capturing a bounded tail of its output, logged
+    line by line to the 'stream' logger if given. Return a tuple with
+    return code and command's output.
     """
-    try:
-        check_ouput = getattr(
-            subprocess, 'check_output', subprocess.check_call)
-        result = check_ouput(command, stderr=subprocess.STDOUT, shell=True)
-        if check_ouput.__name__ == 'check_output':
-            return 0, result
-        else:
-            return result, None
-    except subprocess.CalledProcessError as e:
-        return e.returncode, getattr(e, 'output', None)
+    return execute(command, stream=stream)
+
+
+def _switch_user(entry):
+    os.initgroups(entry.pw_name, entry.pw_gid)
+    os.setgid(entry.pw_gid)
+    os.setuid(entry.pw_uid)
+
+
+def add_keyring_credentials(server, username, password, domain=None,
+                            user=None):
+    """
+    Store the user's credentials for 'server' (or for 'domain' if given) into
+    the kernel keyring with cifscreds, so that a multiuser mount can open a
+    session on behalf of the user. If the credentials are already present
+    they are updated. Run as root, cifscreds is run as the local 'user'
+    (e.g. the one that called sudo), the owner of the keys the kernel looks
+    up. Return a tuple with return code and command's output.
+    """
+    preexec_fn = None
+    if user is not None and os.getuid() == 0:
+        try:
+            preexec_fn = functools.partial(_switch_user, pwd.getpwnam(user))
+        except KeyError:
+            return 1, 'unknown user {0}'.format(user)
+
+    def cifscreds(action):
+        command = [CIFSCREDS_COMMAND_NAME, action, '-u', username]
+        command += ['-d', domain] if domain else [server]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   universal_newlines=True,
+                                   preexec_fn=preexec_fn)
+        output = process.communicate(password + '\n')[0]
+        return process.returncode, output
+
+    returncode, output = cifscreds('add')
+    if returncode != 0 and output and 'already' in output.lower():
+        returncode, output = cifscreds('update')
+    return returncode, output
 
 
 class MountCifsWrapper(object):
@@ -52,15 +145,30 @@ class MountCifsWrapper(object):
         self.share = share
         self.mountpoint = mountpoint
         self.options = kwargs
+        self.credentials = {}
 
     @property
     def command(self):
-        command = ('{self.command_name} -t {self.filesystem_type}'
-                   ' {self.service} {self.mountpoint}'.format(self=self))
+        command = '{0} -t {1} {2} {3}'.format(
+            self.command_name, self.filesystem_type, quote(self.service),
+            quote(self.mountpoint))
         if self.options:
-            command += ' ' + self.options
+            command += ' -o ' + quote(self.options[len('-o '):])
         return command
 
+    @property
+    def umount_command(self):
+        return '{0} {1}'.format(UMOUNT_COMMAND_NAME, quote(self.mountpoint))
+
+    @property
+    def remount_command(self):
+        options = 'remount'
+        if self._options:
+            options += ',' + self.options[len('-o '):]
+        return '{0} -t {1} {2} {3} -o {4}'.format(
+            self.command_name, self.filesystem_type, quote(self.service),
+            quote(self.mountpoint), quote(options))
+
     @property
     def service(self):
         return '//{path}'.format(path=os.path.join(self.server, self.share))
@@ -77,6 +185,41 @@ class MountCifsWrapper(object):
     def options(self, options):
         self._options = options.copy()
 
+    @property
+    def multiuser(self):
+        return 'multiuser' in self._options
+
+    def set_multiuser(self, sec=MULTIUSER_SECURITY):
+        """
+        Turn the wrapper into a host-wide multiuser mount. The personal
+        credentials are moved from the mount options to 'self.credentials',
+        to be stored into the kernel keyring for every user that accesses the
+        share. With 'sec' other than krb5 the session of the mount itself
+        must be authenticated by a 'credentials' file in the options.
+        """
+        for key in PERSONAL_CREDENTIALS:
+            if key in self._options:
+                self.credentials[key] = self._options.pop(key)
+        self._options['multiuser'] = None
+        self._options['sec'] = sec
+        return self.credentials
+
+    @property
+    def personal_credentials(self):
+        """
+        Return a dict with the personal credentials of the wrapper, wherever
+        they are kept (mount options or keyring credentials of multiuser).
+        """
+        credentials = dict(self.credentials)
+        credentials.update((key, self._options[key])
+                           for key in PERSONAL_CREDENTIALS
+                           if key in self._options)
+        return credentials
+
+    def set_personal_credentials(self, **credentials):
+        target = self.credentials if self.multiuser else self._options
+        target.update(credentials)
+
     def __contains__(self, item):
         return True if item in self._options else False
 
@@ -87,13 +230,79 @@ class MountCifsWrapper(object):
         self._options[key] = value
 
 
+class MountBindWrapper(object):
+    """
+    Wrapper of a bind mount that serves 'mountpoint' from a subdirectory of
+    the network share already mounted by the 'source' MountCifsWrapper.
+    """
+
+    def __init__(self, source, subdirectory, mountpoint):
+        self.command_name = MOUNT_COMMAND_NAME
+        self.filesystem_type = None
+        self.source = source
+        self.subdirectory = subdirectory
+        self.mountpoint = mountpoint
+        self.credentials = {}
+
+    @property
+    def server(self):
+        return self.source.server
+
+    @property
+    def share(self):
+        return os.path.join(self.source.share, self.subdirectory).rstrip('/')
+
+    @property
+    def service(self):
+        return '//{path}'.format(path=os.path.join(self.server, self.share))
+
+    @property
+    def path(self):
+        return os.path.join(self.source.mountpoint,
+                            self.subdirectory).rstrip('/')
+
+    @property
+    def command(self):
+        return '{0} --bind {1} {2}'.format(
+            self.command_name, quote(self.path), quote(self.mountpoint))
+
+    @property
+    def umount_command(self):
+        return '{0} {1}'.format(UMOUNT_COMMAND_NAME, quote(self.mountpoint))
+
+
 class MountSmbShares(object):
 
-    def __init__(self, config_file='~/.pygmount.rc'):
+    # seconds to wait between umount and mount of a full remount cycle
+    cycle_delay = 2
+
+    def __init__(self, config_file='~/.pygmount.rc', multiuser=False,
+                 multiuser_sec=MULTIUSER_SECURITY,
+                 multiuser_root=MULTIUSER_ROOT, deduplicate=False,
+                 bind_root=BIND_ROOT, history=None, check_credentials=False,
+                 credentials_prompt=None, breaker=None, dialects=None,
+                 tuning=None, run_lock=None, home=None,
+                 default_options=None):
         self._shares = None
         self._config_file = None
         self._required_packages = None
         self.config_file = config_file
+        self.multiuser = multiuser
+        self.multiuser_sec = multiuser_sec
+        self.multiuser_root = multiuser_root
+        self.deduplicate = deduplicate
+        self.bind_root = os.path.expanduser(bind_root)
+        self.history = history
+        self.check_credentials = check_credentials
+        self.credentials_prompt = credentials_prompt
+        self.breaker = breaker
+        self.dialects = dialects
+        self.tuning = tuning
+        self.run_lock = run_lock
+        self.home = home or os.path.expanduser('~')
+        self.default_options = dict(default_options or {})
+        self.index = collections.OrderedDict()
+        self.report = None
 
     @property
     def required_packages(self):
@@ -138,28 +347,86 @@ class MountSmbShares(object):
     def shares(self):
         return self._shares
 
-    def set_shares(self):
-        self._shares = []
-        config = ConfigParser()
+    def index_sections(self, config, templates=None):
+        """
+        Return an ordered dict with the share sections of 'config' and their
+        tags (the ',' separated values of the 'tags' key, also inherited
+        from templates), read without building the shares. See
+        pygmount.core.config.template_items for 'templates'.
+        """
+        templates = {} if templates is None else templates
+        index = collections.OrderedDict()
+        for section in share_sections(config):
+            tags = section_items(config, section, templates).get('tags', '')
+            index[section] = tuple(tag.strip().lower()
+                                   for tag in tags.split(',') if tag.strip())
+        return index
+
+    def select_sections(self, only=None, tags=None):
+        """
+        Return the sections of 'self.index' named in 'only' and having at
+        least one of 'tags', if given (with both, a section must match
+        both). Unknown names are logged.
+        """
+        sections = list(self.index)
+        if only is not None:
+            only = set(only)
+            for name in only.difference(self.index):
+                logger.warning('Share "%s" not found in %s', name,
+                               self.config_file)
+            sections = [section for section in sections if section in only]
+        if tags is not None:
+            tags = set(tag.lower() for tag in tags)
+            sections = [section for section in sections
+                        if tags.intersection(self.index[section])]
+        return sections
+
+    def set_shares(self, only=None, tags=None):
+        """
+        Read the shares from the config file. The sections are indexed by
+        name and tags first, so that with 'only' (a list of section names)
+        and/or 'tags' (a list of tags) only the selected shares are built.
+
+        The files in the 'include' key of the [pygmount] section are read
+        after the config file. A share takes the keys of [DEFAULT] and of
+        the [template:<name>] section named by its 'template' key (templates
+        can have a 'template' too); its own keys win. The 'default_options'
+        are added to the shares that don't set them, unless in multiuser
+        mode, where a mount serves every user and the default and relative
+        mountpoints are into 'multiuser_root' instead of the home. Raise
+        ValueError for unknown or circular templates and for shares without
+        hostname or share.
+        """
+        shares = []
+        config = RawConfigParser()
         config.read(self.config_file)
-        for share in config.sections():
+        read_includes(config, self.config_file)
+        # every template is expanded once per read
+        templates = {}
+        self.index = self.index_sections(config, templates)
+        for share in self.select_sections(only, tags):
             wrapper_args = [None, None, None]
             wrapper_kwargs = {}
             hooks = [None, None]
-            for key, value in config.items(share):
+            priority = DEFAULT_PRIORITY
+            dialects = None
+            profile = None
+            for key, value in section_items(config, share,
+                                            templates).items():
                 if key == 'hostname':
-                    if '@' not in value:
-                        wrapper_args[0] = value
-                    else:
-                        hostname, credentials = (item[::-1] for item
-                                                 in value[::-1].split('@', 1))
-                        wrapper_args[0] = hostname
-                        credentials = tuple(cred.lstrip('"').rstrip('"')
-                                            for cred in
-                                            credentials.split(':', 1))
-                        wrapper_kwargs.update({'username': credentials[0]})
-                        if len(credentials) > 1:
-                            wrapper_kwargs.update({'password': credentials[1]})
+                    uri = parse_share_uri(value)
+                    wrapper_args[0] = uri.host
+                    for option in ('username', 'password'):
+                        if getattr(uri, option) is not None:
+                            wrapper_kwargs[option] = getattr(uri, option)
+                    # the keys of the section win over the ones of the URI
+                    for option in ('domain', 'port'):
+                        if getattr(uri, option) is not None:
+                            wrapper_kwargs.setdefault(option,
+                                                      getattr(uri, option))
+                    if uri.share and wrapper_args[1] is None:
+                        wrapper_args[1] = '/'.join(
+                            part for part in (uri.share, uri.path) if part)
                 elif key == 'share':
                     wrapper_args[1] = value
                 elif key == 'mountpoint':
@@ -168,19 +435,694 @@ class MountSmbShares(object):
                     hooks[0] = value
                 elif key == 'hook_post_command':
                     hooks[1] = value
+                elif key == 'dialects':
+                    dialects = parse_dialects(value)
+                elif key == 'profile':
+                    profile = value.strip().lower()
+                elif key == 'priority':
+                    priority = (value.lower() if value.lower() in PRIORITIES
+                                else DEFAULT_PRIORITY)
+                elif key == 'tags':
+                    continue
                 else:
                     wrapper_kwargs.update({key: value})
-            self._shares.append(
-                (share, MountCifsWrapper(*wrapper_args, **wrapper_kwargs),)
-                + tuple(hooks))
+            for index, key in enumerate(('hostname', 'share')):
+                if not wrapper_args[index]:
+                    raise ValueError('Nella sezione "{0}" manca "{1}".'.format(
+                        share, key))
+            # like MountSmbSharesOld: default and relative mountpoints are
+            # into the home directory (of the host for multiuser)
+            root = self.multiuser_root if self.multiuser else self.home
+            if not wrapper_args[2]:
+                wrapper_args[2] = os.path.join(root, *wrapper_args[:2])
+            elif not os.path.isabs(wrapper_args[2]):
+                wrapper_args[2] = os.path.join(root, wrapper_args[2])
+            if profile is not None:
+                options = profile_options(profile, self.tuning,
+                                          wrapper_args[0])
+                options.update(wrapper_kwargs)
+                wrapper_kwargs = options
+            if not self.multiuser:
+                # e.g. the uid and gid of the user that called sudo
+                for key, value in self.default_options.items():
+                    wrapper_kwargs.setdefault(key, value)
+            wrapper = MountCifsWrapper(*wrapper_args, **wrapper_kwargs)
+            if self.multiuser:
+                wrapper.set_multiuser(self.multiuser_sec)
+            shares.append(Share(share, wrapper, hooks[0], hooks[1], priority,
+                                dialects))
+        self._shares = shares
+        if self.deduplicate:
+            self.deduplicate_shares()
 
-    def run(self):
-        for package in self.required_packages:
+    def deduplicate_shares(self):
+        """
+        Group the shares that use the same service, credentials and options
+        (also if they point to different subfolders of it) and mount every
+        service only once. If a share of the group mounts the root of the
+        service its mountpoint is used as source, otherwise the service is
+        mounted into a staging directory under 'self.bind_root'. The other
+        shares are replaced by MountBindWrapper of the relevant
+        subdirectories, placed after their source mount.
+        """
+        groups = collections.OrderedDict()
+        for entry in self._shares:
+            wrapper = entry.wrapper
+            root, _, subdirectory = wrapper.share.strip('/').partition('/')
+            key = (wrapper.server.lower(), root.lower(),
+                   tuple(sorted(wrapper._options.items())),
+                   tuple(sorted(wrapper.credentials.items())))
+            groups.setdefault(key, []).append((entry, subdirectory))
+        shares = []
+        for members in groups.values():
+            if len(members) == 1:
+                shares.append(members[0][0])
+                continue
+            primary = next((entry for entry, subdirectory in members
+                            if not subdirectory), None)
+            # the source mount is needed as soon as its first dependent
+            priority = min((entry.priority for entry, _ in members),
+                           key=PRIORITIES.get)
+            if primary is None:
+                wrapper = members[0][0].wrapper
+                root = wrapper.share.strip('/').partition('/')[0]
+                source = MountCifsWrapper(
+                    wrapper.server, root,
+                    os.path.join(self.bind_root, wrapper.server, root),
+                    **wrapper._options)
+                source.credentials = wrapper.credentials.copy()
+                shares.append(Share(source.service, source,
+                                    priority=priority))
+            else:
+                source = primary.wrapper
+                shares.append(primary._replace(priority=priority))
+            for entry, subdirectory in members:
+                if entry is primary:
+                    continue
+                shares.append(entry._replace(
+                    wrapper=MountBindWrapper(source, subdirectory,
+                                             entry.wrapper.mountpoint)))
+        self._shares = shares
+
+    def mount_multiuser(self, wrapper, mount_table=None):
+        """
+        Mount a multiuser share only if the host has not already mounted it,
+        then, with a sec=ntlmssp* mount, add the credentials to the kernel
+        keyring of the user that called sudo (with krb5 the kernel uses the
+        Kerberos tickets of the user). In this way the host has one mount
+        per share instead of one per user. A
+        non-multiuser mount on the mountpoint is unmounted first, instead of
+        stacking the new mount on it (if it can't be unmounted the share is
+        not mounted). Return a tuple with return code and output of the last
+        executed command.
+        """
+        if mount_table is None:
+            mount_table = read_mount_table(
+                filesystem_type=CIFS_FILESYSTEM_TYPE)
+        entry = index_by_mountpoint(mount_table).get(wrapper.mountpoint)
+        returncode, output = 0, None
+        if entry is not None and 'multiuser' not in entry.options:
+            returncode, output = run_command(wrapper.umount_command)
+            if returncode != 0:
+                return returncode, output
+            time.sleep(self.cycle_delay)
+        if entry is None or 'multiuser' not in entry.options:
+            returncode, output = run_command(wrapper.command)
+            if returncode != 0:
+                return returncode, output
+        credentials = wrapper.credentials
+        sec = wrapper['sec'] if 'sec' in wrapper else ''
+        if (sec.startswith('ntlmssp') and credentials.get('username') and
+                credentials.get('password')):
+            returncode, output = add_keyring_credentials(
+                wrapper.server, credentials['username'],
+                credentials['password'], credentials.get('domain'),
+                user=os.environ.get('SUDO_USER'))
+        return returncode, output
+
+    def tune_share(self, share, candidates=None, measure=measure_throughput):
+        """
+        Auto-tune the options of a share: mount its service into a temporary
+        directory with every candidate (a list of tuples profile name,
+        options; by default no profile and all the PROFILES), measure it
+        with 'measure(path)' (higher is better) and store the winner for the
+        server into the tuning cache, used by 'profile = auto'. Return a
+        tuple with the name of the winner (None if no candidate mounted) and
+        a dict with the score of every candidate.
+        """
+        wrapper = share.wrapper
+        if candidates is None:
+            candidates = [(PROFILE_DEFAULT, {})] + list(PROFILES.items())
+        scores = {}
+        for name, options in candidates:
+            merged = collections.OrderedDict(wrapper._options)
+            merged.update(options)
+            mountpoint = tempfile.mkdtemp(prefix='pygmount-tune-')
+            candidate = MountCifsWrapper(wrapper.server, wrapper.share,
+                                         mountpoint, **merged)
             try:
-                self.install_apt_package(package)
-            except InstallRequiredPackageError as irpe:
-                if isinstance(irpe.source, apt.LockFailedException):
-                    return 1
+                returncode, output = run_command(candidate.command)
+                if returncode != 0:
+                    logger.info('Candidate "%s" of "%s" not mounted: %s',
+                                name, share.name, output)
+                    continue
+                try:
+                    scores[name] = measure(mountpoint)
+                except (IOError, OSError) as e:
+                    logger.info('Candidate "%s" of "%s" not measured: %s',
+                                name, share.name, e)
+                finally:
+                    run_command(candidate.umount_command)
+            finally:
+                try:
+                    os.rmdir(mountpoint)
+                except OSError as e:
+                    # EBUSY if the umount failed, left for a later cleanup
+                    logger.warning('Temporary mountpoint %s of "%s" not '
+                                   'removed: %s', mountpoint, share.name, e)
+        if not scores:
+            return None, scores
+        best = max(scores, key=scores.get)
+        if self.tuning is not None:
+            self.tuning.set(wrapper.server, best, dict(candidates)[best],
+                            scores)
+            self.tuning.save()
+        return best, scores
+
+    def reconcile_share(self, wrapper, mount_table=None, phases=None):
+        """
+        Bring the mount of 'wrapper' in line with its configuration against
+        the live mount table: nothing is done if it already matches, option
+        only changes are applied in place with "-o remount" and only if the
+        kernel refuses them (or the service changed) the share is unmounted
+        and mounted again. If 'phases' is a dict it is filled with the
+        duration of every executed command. Return a tuple with the action
+        performed, return code and output of the last command.
+        """
+        if phases is None:
+            phases = {}
+
+        def timed(phase, command):
+            start = time.time()
+            result = run_command(command)
+            phases[phase] = time.time() - start
+            return result
+
+        if mount_table is None:
+            mount_table = read_mount_table()
+        action = reconcile_action(
+            wrapper, index_by_mountpoint(mount_table).get(wrapper.mountpoint))
+        if action == ACTION_NOOP:
+            return action, 0, None
+        if action == ACTION_REMOUNT:
+            returncode, output = timed('remount', wrapper.remount_command)
+            if returncode == 0:
+                return action, returncode, output
+            action = ACTION_CYCLE
+        if action == ACTION_CYCLE:
+            timed('umount', wrapper.umount_command)
+            time.sleep(self.cycle_delay)
+        returncode, output = timed('mount', wrapper.command)
+        return action, returncode, output
+
+    def set_credentials(self, username, password, domain=None):
+        """
+        Set the domain credentials (e.g. asked to the user) on every network
+        share that has no credentials of its own into the config file.
+        """
+        credentials = {'username': username, 'password': password}
+        if domain:
+            credentials['domain'] = domain
+        for share in self.shares:
+            wrapper = share.wrapper
+            if (not isinstance(wrapper, MountBindWrapper) and
+                    'username' not in wrapper.personal_credentials):
+                wrapper.set_personal_credentials(**credentials)
+
+    def verify_credentials(self, prompt=None, attempts=CREDENTIALS_ATTEMPTS,
+                           shares=None):
+        """
+        Verify the credentials of the shares before mounting them, once for
+        every distinct server (or domain, if given) and credentials. If a
+        server refuses them, 'prompt(server, username)' is asked for new
+        credentials (a tuple username, password or None to give up) up to
+        'attempts' times, instead of letting every share fail its own mount
+        and maybe lock the account. Credentials corrected this way are used
+        also for the other servers that had the same ones. Only the entries
+        in 'shares' are checked, if given. Return a list of MountResult for
+        the shares whose credentials were refused, which must not be
+        mounted.
+        """
+        groups = collections.OrderedDict()
+        for share in (self.shares if shares is None else shares):
+            if isinstance(share.wrapper, MountBindWrapper):
+                continue
+            credentials = share.wrapper.personal_credentials
+            if not credentials.get('username') or \
+                    not credentials.get('password'):
+                continue
+            key = ((credentials.get('domain') or share.wrapper.server).lower(),
+                   credentials['username'], credentials['password'])
+            groups.setdefault(key, []).append(share)
+        rejected = []
+        # credentials replaced by the prompt and then accepted, applied to
+        # the groups of the other servers with the same ones
+        corrected = {}
+
+        def replace(group, credentials, username, password):
+            credentials['username'] = username
+            credentials['password'] = password
+            for share in group:
+                share.wrapper.set_personal_credentials(username=username,
+                                                       password=password)
+
+        for group in groups.values():
+            wrapper = group[0].wrapper
+            credentials = wrapper.personal_credentials
+            original = credentials['username'], credentials['password']
+            if original in corrected:
+                replace(group, credentials, *corrected[original])
+            start = time.time()
+            for attempt in range(attempts):
+                state, status = verify_credentials(
+                    wrapper.server, credentials['username'],
+                    credentials['password'], credentials.get('domain'))
+                if state != CHECK_FAILED:
+                    break
+                answer = (prompt(wrapper.server, credentials['username'])
+                          if prompt is not None and attempt + 1 < attempts
+                          else None)
+                if not answer:
+                    break
+                replace(group, credentials, *answer)
+            if (state != CHECK_FAILED and original !=
+                    (credentials['username'], credentials['password'])):
+                corrected[original] = (credentials['username'],
+                                       credentials['password'])
+            if state == CHECK_FAILED:
+                duration = time.time() - start
+                rejected.extend(
+                    MountResult(share.name, share.wrapper.server,
+                                share.wrapper.service,
+                                share.wrapper.mountpoint, ACTION_AUTH_FAILED,
+                                AUTH_FAILED_RETURNCODE, status, duration,
+                                {'credentials': duration})
+                    for share in group)
+        return rejected
+
+    def negotiate_share(self, share, mount_table, phases=None):
+        """
+        Reconcile a share choosing the SMB dialect/options by the dialect
+        cache, if any and if the share has no 'vers' of its own. A live
+        mount that only needs a remount keeps (and caches) its negotiated
+        'vers'. Otherwise the option set cached for the server is injected
+        into the wrapper; without it (or if it stops working) the
+        candidates of the share (or the default ones) are tried in order,
+        once per server, and the first that mounts is cached with its
+        latency. Once an attempt has changed the live mount the next ones
+        mount unconditionally. Return a tuple like reconcile_share.
+        """
+        wrapper = share.wrapper
+        if (self.dialects is None or
+                isinstance(wrapper, MountBindWrapper) or 'vers' in wrapper):
+            return self.reconcile_share(wrapper, mount_table, phases)
+        server = wrapper.server
+        entry = index_by_mountpoint(mount_table).get(wrapper.mountpoint)
+        if entry is not None and entry.options.get('vers'):
+            live = collections.OrderedDict([('vers', entry.options['vers'])])
+            wrapper._options.update(live)
+            if reconcile_action(wrapper, entry) != ACTION_CYCLE:
+                start = time.time()
+                result = self.reconcile_share(wrapper, mount_table, phases)
+                if result[1] == 0:
+                    self.dialects.set(server, live, time.time() - start)
+                    return result
+                # the remount was refused and the share cycled
+                mount_table = []
+            wrapper._options.pop('vers')
+        cached = self.dialects.get(server)
+        if cached is not None:
+            wrapper._options.update(cached)
+            result = self.reconcile_share(wrapper, mount_table, phases)
+            if result[1] == 0 or not is_negotiation_failure(result[2]):
+                return result
+            for key in cached:
+                wrapper._options.pop(key, None)
+            mount_table = []
+        with self.dialects.lock(server):
+            cached = self.dialects.get(server)
+            if cached is not None:
+                wrapper._options.update(cached)
+                return self.reconcile_share(wrapper, mount_table, phases)
+            self.dialects.discard(server)
+            result = None
+            for candidate in (share.dialects or
+                              parse_dialects(DEFAULT_DIALECTS)):
+                wrapper._options.update(candidate)
+                start = time.time()
+                result = self.reconcile_share(wrapper, mount_table, phases)
+                if result[1] == 0:
+                    self.dialects.set(server, candidate, time.time() - start)
+                    return result
+                for key in candidate:
+                    wrapper._options.pop(key, None)
+                if not is_negotiation_failure(result[2]):
+                    break
+                mount_table = []
+            return result
+
+    def mount_share(self, share, mount_table, limiter=None, start=None):
+        """
+        Mount (or reconcile) a single entry of 'self.shares'. If a limiter
+        is given the mount waits for a free slot of its server and reports
+        its latency and outcome to it. If the circuit breaker has the server
+        open the share is skipped at once. If given, 'start(name)' is called
+        right before mounting and the mount is cancelled if it returns
+        False. Return a MountResult.
+        """
+        name, wrapper = share.name, share.wrapper
+        phases = {}
+        breaker = (self.breaker
+                   if not isinstance(wrapper, MountBindWrapper) else None)
+        if breaker is not None and not breaker.allow(wrapper.server):
+            return MountResult(name, wrapper.server, wrapper.service,
+                               wrapper.mountpoint, ACTION_CIRCUIT_OPEN,
+                               errno.EHOSTDOWN, None, 0.0, phases)
+        started = time.time()
+        if limiter is not None:
+            limiter.acquire(wrapper.server)
+            phases['wait'] = time.time() - started
+        if start is not None and not start(name):
+            if limiter is not None:
+                limiter.release(wrapper.server)
+            if breaker is not None:
+                breaker.release(wrapper.server)
+            return MountResult(name, wrapper.server, wrapper.service,
+                               wrapper.mountpoint, ACTION_CANCELLED,
+                               errno.ECANCELED, None, 0.0, phases)
+        started = time.time()
+        action, returncode, output = ACTION_MOUNT, 1, None
+        try:
+            if getattr(wrapper, 'multiuser', False):
+                returncode, output = self.mount_multiuser(wrapper,
+                                                          mount_table)
+                phases['mount'] = time.time() - started
+            else:
+                action, returncode, output = self.negotiate_share(
+                    share, mount_table, phases)
+        finally:
+            duration = time.time() - started
+            if breaker is not None:
+                breaker.record(wrapper.server, returncode == 0 or
+                               not is_network_failure(output))
+            if limiter is not None:
+                limiter.release(
+                    wrapper.server,
+                    None if returncode == 0 and action == ACTION_NOOP
+                    else duration, ok=returncode == 0)
+        return MountResult(name, wrapper.server, wrapper.service,
+                           wrapper.mountpoint, action, returncode, output,
+                           duration, phases)
+
+    def mount_shares(self, max_workers=MAX_WORKERS, limiter=None,
+                     on_result=None, shares=None, start=None, stages=None,
+                     rejected=None):
+        """
+        Mount all the shares (or only the entries of 'self.shares' given in
+        'shares') concurrently with at most 'max_workers' mounts
+        at the same time, further limited per server by an AdaptiveLimiter.
+        With 'check_credentials' the credentials are verified once per
+        server before (unless the 'rejected' results of a check already done
+        are given), and the shares with refused credentials are not
+        mounted. The mount table is read once for the whole stage. Shares
+        start in priority order and, with a history store,
+        longest-expected-first within the same priority. Bind mounts are done
+        after the network mounts they depend on, and skipped if their source
+        failed or had its credentials refused. The shares of servers with an
+        open circuit breaker are skipped. If given, 'on_result' is called
+        with every MountResult as soon as it is available. With a run lock,
+        a run that starts while another is in progress waits for it and
+        reuses its report if it is recent enough (the report has then
+        'coalesced' set). 'start' is passed to mount_share. With the share
+        'stages' of a Pipeline every share passes through them (see
+        pygmount.core.pipeline.run_share) instead of mount_share alone.
+        Return a RunReport with the results and the final limits of every
+        server.
+        """
+        if shares is None:
+            shares = self.shares
+        if self.run_lock is None:
+            return self._mount_shares(max_workers, limiter, on_result, shares,
+                                      start, stages, rejected)
+        reports = []
+
+        def run():
+            reports.append(self._mount_shares(max_workers, limiter,
+                                              on_result, shares, start,
+                                              stages, rejected))
+            return reports[0].to_dict()
+
+        data, coalesced = self.run_lock.run(run)
+        if not coalesced:
+            return reports[0]
+        report = RunReport.from_dict(data)
+        report.coalesced = True
+        if on_result is not None:
+            for result in report.results:
+                on_result(result)
+        return report
+
+    def _mount_shares(self, max_workers, limiter, on_result, shares, start,
+                      stages=None, rejected=None):
+        if limiter is None:
+            limiter = AdaptiveLimiter()
+        report = RunReport()
+
+        outcomes = {}
+
+        def add(result):
+            outcomes[result.name] = result
+            report.add(result)
+            if on_result is not None:
+                on_result(result)
+
+        if rejected is None and self.check_credentials:
+            rejected = self.verify_credentials(self.credentials_prompt,
+                                               shares=shares)
+        skipped = set()
+        for result in rejected or ():
+            skipped.add(result.name)
+            add(result)
+        mount_table = read_mount_table()
+        network_shares = [share for share in shares
+                          if not isinstance(share.wrapper, MountBindWrapper)
+                          and share.name not in skipped]
+        bind_shares = [share for share in shares
+                       if isinstance(share.wrapper, MountBindWrapper)]
+        if self.history is not None:
+            network_shares = longest_first(
+                network_shares, self.history.expected_durations())
+        network_shares.sort(key=lambda share: PRIORITIES[share.priority])
+        if stages:
+            from pygmount.core.pipeline import run_share
+            context = {'mount_table': mount_table, 'start': start,
+                       'probes': {}, 'lock': threading.Lock()}
+
+            def process(share, limiter=None):
+                return run_share(self, share, stages,
+                                 dict(context, limiter=limiter))
+        else:
+            def process(share, limiter=None):
+                return self.mount_share(share, mount_table, limiter, start)
+
+        if futures is None or max_workers <= 1:
+            for share in network_shares:
+                add(process(share, limiter))
+        else:
+            # a share is submitted only when its server has a free slot, so
+            # that a slow server never parks the workers in acquire while
+            # the shares of the other servers wait
+            waiting = list(network_shares)
+            running = {}
+            scheduled = collections.defaultdict(int)
+            with futures.ThreadPoolExecutor(max_workers) as executor:
+                while waiting or running:
+                    for share in list(waiting):
+                        if len(running) >= max_workers:
+                            break
+                        server = share.wrapper.server
+                        if scheduled[server] < limiter.limit(server):
+                            waiting.remove(share)
+                            scheduled[server] += 1
+                            running[executor.submit(
+                                process, share, limiter)] = share
+                    done = futures.wait(
+                        list(running),
+                        return_when=futures.FIRST_COMPLETED)[0]
+                    for future in done:
+                        scheduled[running.pop(future).wrapper.server] -= 1
+                        add(future.result())
+        sources = dict((id(share.wrapper), share.name) for share in shares
+                       if not isinstance(share.wrapper, MountBindWrapper))
+        for share in bind_shares:
+            # a bind of a source that is not mounted would serve the empty
+            # local directory
+            source = outcomes.get(sources.get(id(share.wrapper.source)))
+            if source is not None and source.returncode != 0:
+                add(MountResult(share.name, share.wrapper.server,
+                                share.wrapper.service,
+                                share.wrapper.mountpoint,
+                                ACTION_SOURCE_FAILED, source.returncode,
+                                'source "{0}" not mounted'.format(
+                                    source.name), 0.0, {}))
+                continue
+            add(process(share))
+        report.limits = limiter.snapshot()
+        if self.breaker is not None:
+            self.breaker.save()
+            report.circuits = self.breaker.snapshot()
+        if self.dialects is not None:
+            self.dialects.save()
+        report.finish()
+        if self.history is not None:
+            self.history.record(report)
+        return report
+
+    def mount_all(self, max_workers=MAX_WORKERS, limiter=None, shares=None):
+        """
+        Start mounting all the shares (or the given entries of 'self.shares')
+        as mount_shares does, but in a background thread, and return at once
+        a MountBatch with the future of every share and of the RunReport.
+        The shares not started yet can be cancelled, their MountResult has
+        then the 'cancelled' action. To be used by the programs that embed
+        pygmount and can't block, e.g. with asyncio (see pygmount.core.aio).
+        """
+        if shares is None:
+            shares = self.shares
+        batch = MountBatch(share.name for share in shares)
+
+        def run():
+            try:
+                batch.set_report(self.mount_shares(
+                    max_workers, limiter, batch.set_result, shares,
+                    batch.start))
+            except Exception as e:
+                logger.exception('Mount run failed')
+                batch.set_exception(e)
+
+        thread = threading.Thread(target=run, name='pygmount-mount-all')
+        thread.daemon = True
+        thread.start()
+        return batch
+
+    def mount_shares_in_budget(self, budget, max_workers=MAX_WORKERS,
+                               limiter=None, stages=None):
+        """
+        Mount the shares within a foreground time budget of 'budget' seconds.
+        The mounts are done by a detached background worker, which goes on
+        after this method returns and logs its results. This method waits
+        for all the 'critical' shares, then for the others until everything
+        is mounted or the budget is over. Return a RunReport with the
+        results received so far; the names of the shares left to the
+        background worker are in its 'pending' list. With
+        'check_credentials' the credentials are verified (and maybe asked
+        again) here, since the worker has no terminal, and the budget starts
+        after that.
+        """
+        rejected = (self.verify_credentials(self.credentials_prompt)
+                    if self.check_credentials else [])
+        deadline = time.time() + budget
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self._background_worker(write_fd, max_workers, limiter, stages,
+                                    rejected)
+        os.close(write_fd)
+        os.waitpid(pid, 0)
+        report = RunReport()
+        waiting = set(share.name for share in self.shares)
+        critical = set(share.name for share in self.shares
+                       if share.priority == 'critical')
+        data = b''
+        while waiting:
+            timeout = (None if critical & waiting
+                       else max(0, deadline - time.time()))
+            if not select.select([read_fd], [], [], timeout)[0]:
+                break
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            lines = (data + chunk).split(b'\n')
+            data = lines.pop()
+            for line in lines:
+                result = result_from_dict(json.loads(line.decode('utf-8')))
+                waiting.discard(result.name)
+                report.add(result)
+        os.close(read_fd)
+        report.pending = [share.name for share in self.shares
+                          if share.name in waiting]
+        report.finish()
+        return report
+
+    def _background_worker(self, write_fd, max_workers, limiter,
+                           stages=None, rejected=None):
+        """
+        Body of the process forked by mount_shares_in_budget: detach from
+        the session of the caller, mount all the shares but the 'rejected'
+        ones streaming every result to 'write_fd' while the caller listens
+        and log them.
+        """
+        log_queue = None
+        try:
+            os.setsid()
+            if os.fork() != 0:
+                os._exit(0)
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            # the handlers of the caller write to the terminal just left (or
+            # to a queue whose listener thread did not survive the fork)
+            reset_logging()
+            log_queue = setup_logging(os.path.join(
+                self.home, os.path.basename(LOG_FILE)))
+            if self.history is not None:
+                self.history = self.history.__class__(self.history.filename)
+            pipe = [write_fd]
 
+            def on_result(result):
+                logger.info('Share "%s" %s with return code %s in %.2fs',
+                            result.name, result.action, result.returncode,
+                            result.duration)
+                if pipe:
+                    try:
+                        os.write(pipe[0], json.dumps(
+                            result_to_dict(result)).encode('utf-8') + b'\n')
+                    except (IOError, OSError):
+                        # the foreground process has already returned
+                        os.close(pipe.pop())
 
+            self.mount_shares(max_workers, limiter, on_result, stages=stages,
+                              rejected=rejected)
+        except Exception:
+            logger.exception('Background mount worker failed')
+        finally:
+            # os._exit skips atexit: write the records still in the queue
+            if log_queue is not None:
+                log_queue.stop()
+            os._exit(0)
 
+    def run(self, pipeline=None):
+        """
+        Run the whole mount process as a Pipeline of stages (by default
+        requirements, config, credentials, mount and report, with every
+        share passing through resolve, mkdir, hooks and mount; see
+        pygmount.core.pipeline). The RunReport is kept in 'self.report'.
+        Return the exit code.
+        """
+        from pygmount.core.pipeline import Pipeline
+        if pipeline is None:
+            pipeline = Pipeline()
+        returncode = pipeline.run(self)
+        self.report = pipeline.report
+        return returncode
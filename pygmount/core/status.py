@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+
+from pygmount.core.listener import alive_paths
+from pygmount.core.mtab import read_mount_table, index_by_mountpoint
+from pygmount.core.reconcile import diff_options
+
+
+STATE_MOUNTED = 'mounted'
+STATE_MISSING = 'missing'
+STATE_MISMATCHED = 'mismatched-options'
+STATE_STALE = 'stale'
+
+STALE_TIMEOUT = 1.0
+
+ShareStatus = collections.namedtuple(
+    'ShareStatus', ['name', 'server', 'service', 'mountpoint', 'state',
+                    'differences'])
+
+
+def share_states(shares, mount_table=None, check_stale=True,
+                 timeout=STALE_TIMEOUT):
+    """
+    Join the shares with the mount table (read once if not given) in a
+    single pass and return a ShareStatus for every share: missing if
+    nothing is mounted on its mountpoint, mismatched-options if another
+    service or other options are mounted there ('differences' has the
+    configured values that differ, the live service under 'service'),
+    stale if the mount does not answer within 'timeout' seconds (checked
+    for all the mounts at the same time), mounted otherwise.
+    """
+    if mount_table is None:
+        mount_table = read_mount_table()
+    entries = index_by_mountpoint(mount_table)
+    statuses = []
+    for share in shares:
+        wrapper = share.wrapper
+        entry = entries.get(wrapper.mountpoint)
+        differences = {}
+        if entry is None:
+            state = STATE_MISSING
+        elif wrapper.filesystem_type is None:
+            # bind mounts carry no options of their own
+            state = STATE_MOUNTED
+        elif entry.service.lower() != wrapper.service.lower():
+            state = STATE_MISMATCHED
+            differences = {'service': entry.service}
+        else:
+            differences = diff_options(wrapper._options, entry.options)
+            state = STATE_MISMATCHED if differences else STATE_MOUNTED
+        statuses.append(ShareStatus(share.name, wrapper.server,
+                                    wrapper.service, wrapper.mountpoint,
+                                    state, differences))
+    if check_stale:
+        mounted = [status.mountpoint for status in statuses
+                   if status.state != STATE_MISSING]
+        alive = alive_paths(mounted, timeout)
+        statuses = [status._replace(state=STATE_STALE)
+                    if status.state != STATE_MISSING and
+                    status.mountpoint not in alive else status
+                    for status in statuses]
+    return statuses
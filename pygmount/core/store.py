@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import io
+import json
+import os
+import os.path
+import threading
+
+
+class ServerStore(object):
+    """
+    Base of the small local stores with a JSON object of data by server
+    (circuit breaker, dialect cache, tuning cache). The file is read once,
+    an unreadable one is ignored, and written atomically by save(). The
+    subclasses access '_servers' holding '_lock' (a threading.Lock unless
+    another lock, e.g. a Condition, is given).
+    """
+
+    def __init__(self, filename, lock=None):
+        self.filename = os.path.expanduser(filename)
+        self._lock = lock or threading.Lock()
+        self._servers = {}
+        if os.path.exists(self.filename):
+            try:
+                with io.open(self.filename, encoding='utf-8') as f:
+                    self._servers = json.load(f)
+            except ValueError:
+                self._servers = {}
+
+    def save(self):
+        """
+        Write the store atomically to its file.
+        """
+        with self._lock:
+            data = json.dumps(self._servers)
+        temporary = '{0}.{1}.tmp'.format(self.filename, os.getpid())
+        with open(temporary, 'w') as f:
+            f.write(data)
+        os.rename(temporary, self.filename)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+import io
+import os
+import os.path
+import re
+
+from pygmount.core.samba import (CIFS_FILESYSTEM_TYPE, PERSONAL_CREDENTIALS,
+                                 MountBindWrapper)
+
+
+LAZY_PRIORITIES = ('normal', 'low')
+IDLE_TIMEOUT = 600
+MOUNT_TIMEOUT = 30
+AUTOFS_MAP_FILE = 'auto.pygmount'
+
+_UNSAFE_CHARACTERS = re.compile(r'[^a-zA-Z0-9:_.]')
+
+MOUNT_UNIT = """[Unit]
+Description=pygmount share {name}
+{dependencies}
+[Mount]
+What={what}
+Where={where}
+Type={type}
+Options={options}
+TimeoutSec={timeout}
+{install}"""
+
+AUTOMOUNT_UNIT = """[Unit]
+Description=pygmount automount of share {name}
+
+[Automount]
+Where={where}
+TimeoutIdleSec={idle_timeout}
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+INSTALL_SECTION = """
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def escape_path(path):
+    """
+    Escape 'path' as 'systemd-escape --path' does, to be used as name of
+    the units of a mountpoint.
+    """
+    path = re.sub('/+', '/', path).strip('/')
+    if not path:
+        return '-'
+    escaped = _UNSAFE_CHARACTERS.sub(
+        lambda m: ''.join('\\x{0:02x}'.format(byte) for byte in
+                          bytearray(m.group(0).encode('utf-8'))),
+        path.replace('/', '\0'))
+    if escaped.startswith('.'):
+        escaped = '\\x2e' + escaped[1:]
+    return escaped.replace('\\x00', '-')
+
+
+def unit_name(mountpoint, suffix='mount'):
+    return '{0}.{1}'.format(escape_path(mountpoint), suffix)
+
+
+def format_options(options, credentials_file=None):
+    """
+    Return the comma separated mount options of a wrapper without the
+    personal credentials, which are replaced by 'credentials_file'.
+    """
+    text = [key if value is None else '{0}={1}'.format(key, value)
+            for key, value in options.items()
+            if key not in PERSONAL_CREDENTIALS]
+    if credentials_file:
+        text.append('credentials={0}'.format(credentials_file))
+    return ','.join(text)
+
+
+def credentials_content(credentials):
+    """
+    Return the content of a mount.cifs credentials file.
+    """
+    return ''.join('{0}={1}\n'.format(key, credentials[key])
+                   for key in PERSONAL_CREDENTIALS if key in credentials)
+
+
+def mount_unit(share, credentials_file=None, install=True):
+    """
+    Return the content of the systemd .mount unit of a Share.
+    """
+    wrapper = share.wrapper
+    if isinstance(wrapper, MountBindWrapper):
+        source = unit_name(wrapper.source.mountpoint)
+        return MOUNT_UNIT.format(
+            name=share.name,
+            dependencies='Requires={0}\nAfter={0}\n'.format(source),
+            what=wrapper.path, where=wrapper.mountpoint, type='none',
+            options='bind', timeout=MOUNT_TIMEOUT,
+            install=INSTALL_SECTION if install else '')
+    return MOUNT_UNIT.format(
+        name=share.name,
+        dependencies='Wants=network-online.target\n'
+                     'After=network-online.target\n',
+        what=wrapper.service, where=wrapper.mountpoint,
+        type=CIFS_FILESYSTEM_TYPE,
+        options=format_options(
+            collections.OrderedDict(
+                [('_netdev', None)] + list(wrapper._options.items())),
+            credentials_file),
+        timeout=MOUNT_TIMEOUT, install=INSTALL_SECTION if install else '')
+
+
+def automount_unit(share, idle_timeout=IDLE_TIMEOUT):
+    """
+    Return the content of the systemd .automount unit of a Share.
+    """
+    return AUTOMOUNT_UNIT.format(name=share.name,
+                                 where=share.wrapper.mountpoint,
+                                 idle_timeout=idle_timeout)
+
+
+def autofs_map(shares, credentials_files=None):
+    """
+    Return the content of an autofs direct map (to be referenced with
+    '/- /etc/auto.pygmount' into auto.master) mounting every share on first
+    access. 'credentials_files' maps share names to credentials files.
+    """
+    credentials_files = credentials_files or {}
+    lines = []
+    for share in shares:
+        wrapper = share.wrapper
+        if isinstance(wrapper, MountBindWrapper):
+            lines.append('{0} -fstype=bind :{1}'.format(
+                wrapper.mountpoint, wrapper.path))
+            continue
+        options = format_options(wrapper._options,
+                                 credentials_files.get(share.name))
+        lines.append('{0} -fstype={1}{2} :{3}'.format(
+            wrapper.mountpoint, CIFS_FILESYSTEM_TYPE,
+            ',' + options if options else '', wrapper.service))
+    return '\n'.join(lines) + '\n'
+
+
+def _write(path, content, mode=0o644):
+    with io.open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode),
+                 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.chmod(path, mode)
+    return path
+
+
+def write_units(shares, directory, autofs=False,
+                lazy_priorities=LAZY_PRIORITIES, idle_timeout=IDLE_TIMEOUT):
+    """
+    Write into 'directory' the systemd units (or with autofs=True the autofs
+    direct map) of the shares, together with a private credentials file for
+    every share that has credentials. With systemd, the shares with a
+    priority in 'lazy_priorities' get an .automount unit and are mounted on
+    first access, the others are mounted at boot. Return the list of the
+    written files.
+    """
+    directory = os.path.abspath(directory)
+    written = []
+    credentials_files = {}
+    for share in shares:
+        if isinstance(share.wrapper, MountBindWrapper):
+            continue
+        credentials = share.wrapper.personal_credentials
+        if credentials:
+            path = os.path.join(directory, unit_name(
+                share.wrapper.mountpoint, 'credentials'))
+            written.append(_write(path, credentials_content(credentials),
+                                  0o600))
+            credentials_files[share.name] = path
+    if autofs:
+        written.append(_write(os.path.join(directory, AUTOFS_MAP_FILE),
+                              autofs_map(shares, credentials_files)))
+        return written
+    for share in shares:
+        lazy = share.priority in lazy_priorities
+        written.append(_write(
+            os.path.join(directory, unit_name(share.wrapper.mountpoint)),
+            mount_unit(share, credentials_files.get(share.name),
+                       install=not lazy)))
+        if lazy:
+            written.append(_write(
+                os.path.join(directory,
+                             unit_name(share.wrapper.mountpoint,
+                                       'automount')),
+                automount_unit(share, idle_timeout)))
+    return written
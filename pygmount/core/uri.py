@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import collections
+try:
+    from urllib.parse import unquote
+except ImportError:
+    from urllib import unquote
+
+
+SCHEMES = ('smb', 'cifs')
+QUOTE = '"'
+
+# 'share' and 'path' are None for a bare '[user[:password]@]host'
+ShareURI = collections.namedtuple('ShareURI', [
+    'domain', 'username', 'password', 'host', 'port', 'share', 'path'])
+
+
+def _unquote(value):
+    # values can be written as "value" to protect ':' and '@'
+    return value.lstrip(QUOTE).rstrip(QUOTE)
+
+
+def parse_share_uri(value):
+    """
+    Parse the 'hostname' value of a share in one pass and return a
+    ShareURI. 'value' is either '[user[:password]@]host', with user and
+    password optionally between '"', or an URI like
+    'smb://[domain;][user[:password]@]host[:port][/share[/path]]' (also
+    'cifs://' or '//'), with user and password optionally %-encoded.
+    Without '@' username and password are None, without ':' password is
+    None. Raise ValueError for URIs of other schemes or without host.
+    """
+    value = value.strip()
+    scheme, separator, rest = value.partition('://')
+    if separator:
+        if scheme.lower() not in SCHEMES:
+            raise ValueError('Schema "{0}" non supportato in "{1}".'.format(
+                scheme, value))
+    elif value.startswith('//'):
+        rest = value[2:]
+    else:
+        # the last '@' splits, so that passwords can contain it
+        credentials, at, host = value.rpartition('@')
+        username, colon, password = credentials.partition(':')
+        return ShareURI(None, _unquote(username) if at else None,
+                        _unquote(password) if colon else None, host, None,
+                        None, None)
+    authority, slash, path = rest.partition('/')
+    credentials, at, address = authority.rpartition('@')
+    domain, semicolon, credentials = credentials.rpartition(';')
+    username, colon, password = credentials.partition(':')
+    host, colon_port, port = address.partition(':')
+    if address.startswith('['):
+        host, bracket, port = address.partition(']')
+        host += bracket
+        port = port[1:]
+    if not host:
+        raise ValueError('Host mancante in "{0}".'.format(value))
+    share, slash, path = path.strip('/').partition('/')
+    return ShareURI(unquote(domain) if semicolon else None,
+                    _unquote(unquote(username)) if at else None,
+                    _unquote(unquote(password)) if colon else None,
+                    host, port or None, share or None, path or None)
@@ -6,12 +6,13 @@ import datetime
 import sys
 import os
 import os.path
-import subprocess
 import time
 import apt
 import logging
 from apt.cache import LockFailedException
 from PyZenity import Question, GetText, InfoMessage, ErrorMessage, Progress
+from pygmount.core.logs import setup_logging
+from pygmount.core.process import execute
 from pygmount.utils.utils import get_sudo_username, read_config, get_home_dir
 
 FILE_RC = '.pygmount.rc'
@@ -50,9 +51,11 @@ class MountSmbSharesOld(object):
         self.cmd_umount = "umount %(mountpoint)s"
         self.msg_error = "Impossibile collegare le unità di rete [%s]."
         self.home_dir = get_home_dir()
-        logging.basicConfig(
+        # the home directory can be on a network filesystem: log through a
+        # queue, so that writing the log never slows the mounts down
+        self.log_queue = setup_logging(
             filename='{}{}/.pygmount.log'.format(self.home_dir, self.username),
-            filemode='a', level=logging.INFO)
+            level=logging.INFO)
 
     def requirements(self):
         """
@@ -191,9 +194,7 @@ class MountSmbSharesOld(object):
             if self.verbose:
                 logging.warning("Umount command: %s" % umont_cmd)
             if not self.dry_run:
-                umount_p = subprocess.Popen(umont_cmd,
-                                            shell=True)
-                returncode = umount_p.wait()
+                returncode, output = execute(umont_cmd)
                 time.sleep(2)
 
             mount_cmd = self.cmd_mount % share
@@ -206,14 +207,12 @@ class MountSmbSharesOld(object):
             # print("#######")
             if not self.dry_run:
                 # montaggio della condivisione
-                p_mnt = subprocess.Popen(mount_cmd, shell=True,
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.PIPE)
-                returncode = p_mnt.wait()
+                returncode, output = execute(
+                    mount_cmd,
+                    stream=logging.getLogger() if self.verbose else None)
                 result.append({'share': share['share'],
                                'returncode': returncode,
-                               'stdout': p_mnt.stdout.read(),
-                               'stderr': p_mnt.stderr.read()})
+                               'output': output})
         progress(100)
         if self.verbose:
             logging.warning("Risultati: %s" % result)
@@ -4,9 +4,11 @@ from __future__ import unicode_literals, absolute_import
 import os
 import platform
 try:
-    from ConfigParser import ConfigParser
+    from ConfigParser import RawConfigParser
 except ImportError:
-    from configparser import ConfigParser
+    from configparser import RawConfigParser
+
+from pygmount.core.uri import parse_share_uri
 
 
 def get_sudo_username():
@@ -51,21 +53,24 @@ def read_config(filename=None):
     if not os.path.exists(filename):
         raise IOError('Impossibile trovare il filename %s' % filename)
     shares = []
-    config = ConfigParser()
+    config = RawConfigParser()
     config.read(filename)
     for share_items in [config.items(share_title) for share_title in
                         config.sections()]:
         dict_share = {}
         for key, value in share_items:
-            if key == 'hostname' and '@' in value:
-                hostname, credentials = (item[::-1] for item
-                                         in value[::-1].split('@', 1))
-                dict_share.update({key: hostname})
-                credentials = tuple(cred.lstrip('"').rstrip('"')
-                                    for cred in credentials.split(':', 1))
-                dict_share.update({'username': credentials[0]})
-                if len(credentials) > 1:
-                    dict_share.update({'password': credentials[1]})
+            if key == 'hostname':
+                uri = parse_share_uri(value)
+                dict_share.update({key: uri.host})
+                for option in ('username', 'password'):
+                    if getattr(uri, option) is not None:
+                        dict_share[option] = getattr(uri, option)
+                for option in ('domain', 'port'):
+                    if getattr(uri, option) is not None:
+                        dict_share.setdefault(option, getattr(uri, option))
+                if uri.share:
+                    dict_share.setdefault('share', '/'.join(
+                        part for part in (uri.share, uri.path) if part))
                 continue
             dict_share.update({key: value})
         shares.append(dict_share)
@@ -58,7 +58,8 @@ setup(
     ],
     entry_points={
         'console_scripts': [
-            'mount-smb-shares = pygmount.app.mount_smb_shares:main'
+            'mount-smb-shares = pygmount.app.mount_smb_shares:main',
+            'pygmount-lint = pygmount.app.lint:main'
         ]
     },
     license="BSD",
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+import sys
+
+# the asyncio interface needs Python >= 3.7
+collect_ignore = ['test_aio.py'] if sys.version_info < (3, 7) else []
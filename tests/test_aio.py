@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch, Mock
+
+from pygmount.core import aio
+from pygmount.core.report import MountResult
+from pygmount.core.samba import MountSmbShares, MountCifsWrapper, Share
+
+
+class AioTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mss = MountSmbShares()
+        self.mss._shares = [
+            Share(name, MountCifsWrapper('srv', name, '/mnt/' + name))
+            for name in ('a', 'b', 'c')]
+        patcher = patch('pygmount.core.samba.read_mount_table',
+                        Mock(return_value=[]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.release = threading.Event()
+        self.mounted = []
+
+        def mount_share(share, mount_table, limiter=None, start=None):
+            if start is not None and not start(share.name):
+                return MountResult(share.name, 'srv', None, None,
+                                   'cancelled', 125, None, 0.0, {})
+            self.mounted.append(share.name)
+            if share.name == 'a':
+                self.release.wait(5)
+            return MountResult(share.name, 'srv', None, None, 'mount', 0,
+                               None, 0.0, {})
+
+        self.mss.mount_share = mount_share
+
+    def test_async_for_results_as_completed(self):
+        async def collect():
+            names = []
+            async for result in self.mss.mount_all(max_workers=3):
+                names.append(result.name)
+                if len(names) == 2:
+                    self.release.set()
+            return names
+
+        names = asyncio.run(collect())
+        self.assertEqual(sorted(names[:2]), ['b', 'c'])
+        self.assertEqual(names[2], 'a')
+
+    def test_mount_all_coroutine_return_report(self):
+        self.release.set()
+        report = asyncio.run(aio.mount_all(self.mss, max_workers=2))
+        self.assertEqual(sorted(r.name for r in report.results),
+                         ['a', 'b', 'c'])
+
+    def test_cancel_coroutine_cancel_mounts_not_started(self):
+        async def cancel():
+            task = asyncio.ensure_future(aio.mount_all(self.mss,
+                                                       max_workers=1))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await asyncio.sleep(0.1)
+            self.release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel())
+        self.assertEqual(self.mounted, ['a'])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import string
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+import pytest
+
+from pygmount.core.uri import parse_share_uri, ShareURI
+
+hypothesis = pytest.importorskip('hypothesis')
+st = pytest.importorskip('hypothesis.strategies')
+assume, given = hypothesis.assume, hypothesis.given
+
+
+names = st.text(alphabet=string.ascii_letters + string.digits + '-_.',
+                min_size=1, max_size=20)
+# printable text, '"' excluded since it is stripped around the credentials
+secrets = st.text(alphabet=st.characters(min_codepoint=32,
+                                         max_codepoint=0x2ff),
+                  max_size=20).filter(lambda value: '"' not in value)
+ports = st.integers(min_value=1, max_value=65535).map(str)
+
+
+def encode(value):
+    return quote(value.encode('utf-8'), safe='')
+
+
+def legacy_parse(value):
+    # the parser used by set_shares and read_config before parse_share_uri
+    if '@' not in value:
+        return value, None, None
+    hostname, credentials = (item[::-1] for item
+                             in value[::-1].split('@', 1))
+    credentials = tuple(cred.lstrip('"').rstrip('"')
+                        for cred in credentials.split(':', 1))
+    return (hostname, credentials[0],
+            credentials[1] if len(credentials) > 1 else None)
+
+
+@given(st.text(alphabet=st.characters(min_codepoint=32, max_codepoint=126)))
+def test_hostname_as_legacy_parser(value):
+    assume(value == value.strip())
+    assume('://' not in value and not value.startswith('//'))
+    uri = parse_share_uri(value)
+    assert (uri.host, uri.username, uri.password) == legacy_parse(value)
+    assert (uri.domain, uri.port, uri.share, uri.path) == (None,) * 4
+
+
+@given(st.one_of(st.none(), secrets.filter(bool)),
+       st.one_of(st.none(), secrets),
+       st.one_of(st.none(), secrets), names, st.one_of(st.none(), ports),
+       st.one_of(st.none(), names),
+       st.lists(names, max_size=3).map('/'.join))
+def test_uri_round_trip(domain, username, password, host, port, share,
+                        path):
+    assume(username is not None or (domain is None and password is None))
+    credentials = ''
+    if username is not None:
+        credentials = encode(username)
+        if password is not None:
+            credentials += ':' + encode(password)
+        if domain is not None:
+            credentials = encode(domain) + ';' + credentials
+        credentials += '@'
+    value = 'smb://{0}{1}{2}'.format(credentials, host,
+                                     ':' + port if port else '')
+    if share:
+        value += '/' + share + ('/' + path if path else '')
+    assert parse_share_uri(value) == ShareURI(
+        domain, username, password, host, port, share,
+        path if share and path else None)